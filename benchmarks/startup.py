@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Measure how long `eppdperf -h` takes, and fail if it exceeds the startup target.
+
+The help output and the pure analysis commands must not import deltachat, imapclient or the FFI bindings, which are
+only needed once a command creates accounts.
+
+    python benchmarks/startup.py
+"""
+
+import sys
+import time
+import statistics
+import subprocess
+
+STARTUP_TARGET = 0.25  # seconds, median of `eppdperf -h`
+HEAVY_MODULES = ("deltachat", "imapclient")
+RUNS = 10
+
+
+def measure_help() -> float:
+    """Run `eppdperf -h` in a fresh interpreter.
+
+    :return: the wall time in seconds
+    """
+    begin = time.time()
+    subprocess.run([sys.executable, "-m", "eppdperf.cmdline", "-h"], check=True, stdout=subprocess.DEVNULL)
+    return time.time() - begin
+
+
+def get_heavy_imports() -> [str]:
+    """Import the command line module in a fresh interpreter.
+
+    :return: the heavy modules which were imported on the way
+    """
+    check = "import sys, eppdperf.cmdline; print(' '.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+    result = subprocess.run([sys.executable, "-c", check], check=True, stdout=subprocess.PIPE)
+    return result.stdout.decode().split()
+
+
+def main():
+    heavy = get_heavy_imports()
+    durations = [measure_help() for _ in range(RUNS)]
+    median = statistics.median(durations)
+    print("eppdperf -h: median %.3f seconds over %d runs, target %.3f seconds" % (median, RUNS, STARTUP_TARGET))
+    if heavy:
+        print("[ERROR] importing eppdperf.cmdline loaded %s" % (", ".join(heavy),))
+    if heavy or median > STARTUP_TARGET:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
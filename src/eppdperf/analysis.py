@@ -1,4 +1,9 @@
+import io
 import socket
+import zlib
+import imaplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import deltachat
 from deltachat.tracker import ConfigureFailed
@@ -9,22 +14,32 @@ import imapclient
 import smtplib
 import ssl
 from email.mime.text import MIMEText
+from email.utils import make_msgid
 from .plugins import SpiderPlugin, TestPlugin, parse_msg
-from deltachat.tracker import ConfigureFailed
-
+from .output import TESTED_CAPABILITIES
+from .tracing import span, tracer
+from .progress import reporter
+from .deadlines import Deadlines
+from .preflight import LimitsCache, estimate_message_size, check_limits
+from .configstages import get_configure_stages
+from .dnscache import measure_lookup
 
-TESTED_CAPABILITIES = ("IDLE", "CONDSTORE", "QRESYNC", "COMPRESS=DEFLATE", "UIDPLUS", "MOVE")
 
-
-def grouptest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int):
-    """Add all test accounts to a group; all test accounts then write to it; wait until test complete or timeout.
+def grouptest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int,
+              deadlines: Deadlines = None):
+    """Add all test accounts to a group; all test accounts then write to it; wait until test complete or all
+    outstanding messages are overdue.
 
     :param spac: spider account which adds everyone to the group initially
     :param output: Output object which gathers the test results
     :param accounts: test accounts
     :param timeout: timeout in seconds
+    :param deadlines: per-provider deadlines; without them, the timeout applies to all providers
     """
+    if deadlines is None:
+        deadlines = Deadlines({}, timeout)
     # create test group
+    output.start_group_round([ac.get_config("addr") for ac in accounts])
     begin = time.time()
     print("Creating group " + str(begin))
     group = spac.create_group_chat("Test Group " + str(begin),
@@ -33,16 +48,17 @@ def grouptest(spac: deltachat.Account, output, accounts: [deltachat.Account], ti
 
     # The test accounts send messages to the group in the background; see plugins.TestPlugin.ac_incoming_message
     try:
-        output.groupmsgs_completed.wait(timeout=timeout)
+        longest = deadlines.get_longest(output.group_members)
+        with span("wait for group messages"), reporter.watch(output, "group", longest, deadlines, begin):
+            while not output.groupmsgs_completed.wait(timeout=1):
+                if deadlines.is_over(output.get_outstanding(), begin):
+                    break
     except KeyboardInterrupt:
         print("Test interrupted.")
 
-    group_members = []
-    for ac in accounts:
-        for chat in ac.get_chats():
-            if chat.get_name() == group.get_name():
-                group_members.append(ac)
-    if time.time() > begin + timeout:
+    # the test accounts report the chat ID of the group when they are added
+    group_members = [ac for ac in accounts if ac.get_config("addr") in output.group_chats]
+    if not output.groupmsgs_completed.is_set():
         print("Timeout reached.", end=" ")
     if len(group_members) is not len(accounts):
         print("Not added to group: ")
@@ -51,7 +67,29 @@ def grouptest(spac: deltachat.Account, output, accounts: [deltachat.Account], ti
                 print(ac.get_self_contact().addr)
 
 
-def interoptest(output, accounts: [deltachat.Account], timeout: int, select, dkim_check=False):
+def groupscalingtest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, sizes: [int],
+                     deadlines: Deadlines = None):
+    """Run the group test with growing groups, to see how group add and fan-out latency grow with membership.
+
+    :param spac: spider account which adds everyone to the groups
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param timeout: timeout in seconds for each group
+    :param sizes: how many test accounts are added to each group
+    :param deadlines: per-provider deadlines for each group; without them, the timeout applies to all providers
+    """
+    for size in sizes:
+        if size > len(accounts):
+            print("Skipping group of %s, there are only %s test accounts" % (size, len(accounts)))
+            continue
+        print("Group scaling test with %s members" % (size,))
+        with span("group round", members=size):
+            grouptest(spac, output, accounts[:size], timeout, deadlines)
+        output.finish_group_round(size)
+
+
+def interoptest(output, accounts: [deltachat.Account], timeout: int, select, dkim_check=False,
+                deadlines: Deadlines = None):
     """send a message from each account to all other accounts.
 
     :param output: Output object which gathers the test results
@@ -59,7 +97,10 @@ def interoptest(output, accounts: [deltachat.Account], timeout: int, select, dki
     :param timeout: timeout in seconds
     :param select: if -s is provided, only this account sends out
     :param dkim_check: if dkimchecks test is run, gather the MIME headers and send them to output
+    :param deadlines: per-provider deadlines; without them, the timeout applies to all providers
     """
+    if deadlines is None:
+        deadlines = Deadlines({}, timeout)
     sent_messages = []
 
     for sender in accounts:
@@ -81,24 +122,33 @@ def interoptest(output, accounts: [deltachat.Account], timeout: int, select, dki
             else:
                 msg = chat.send_text("Begin: %s\nTest: interop" % (begin,))
             sent_messages.append(msg)
+            tracer.add_span("send message", sender.get_config("addr"), begin, time.time(),
+                            {"receiver": receiver.get_config("addr")})
 
-    print("Sent out %s messages, waiting %s seconds" % (len(sent_messages), timeout))
+    longest = deadlines.get_longest(output.accounts)
+    print("Sent out %s messages, waiting up to %.0f seconds" % (len(sent_messages), longest))
     begin = time.time()
     try:
-        while not output.interop_completed.is_set() and time.time() < begin + timeout:
-            pending_messages = sent_messages.copy()
-            for msg in pending_messages:
-                if msg.is_out_failed():
-                    receiver = msg.chat.get_name()
-                    sender = msg.get_sender_contact().addr
-                    status = parse_msg(msg.get_message_info())["error"]
-                    output.submit_interop_result(receiver, sender, status)
-                    sent_messages.remove(msg)
+        with reporter.watch(output, "dkimchecks" if dkim_check else "interop", longest, deadlines, begin):
+            while not output.interop_completed.wait(timeout=1):
+                if deadlines.is_over(output.get_outstanding(), begin):
+                    break
+                pending_messages = sent_messages.copy()
+                for msg in pending_messages:
+                    if msg.is_out_failed():
+                        receiver = msg.chat.get_name()
+                        sender = msg.get_sender_contact().addr
+                        status = parse_msg(msg.get_message_info())["error"]
+                        output.submit_interop_result(receiver, sender, status)
+                        sent_messages.remove(msg)
     except KeyboardInterrupt:
         print("Interrupted Timeout.")
+    tracer.add_span("wait for messages", "main", begin, time.time())
 
 
-def filetest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, testfile: str):
+def filetest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, testfile: str,
+             deadlines: Deadlines = None, spiders: [deltachat.Account] = None, limits: LimitsCache = None,
+             skip: bool = True):
     """All test accounts send a test file to the spider.
 
     :param spac: spider account to which the file is sent
@@ -106,30 +156,49 @@ def filetest(spac: deltachat.Account, output, accounts: [deltachat.Account], tim
     :param accounts: test accounts
     :param timeout: timeout in seconds
     :param testfile: absolute path to the test file
+    :param deadlines: per-provider deadlines; without them, the timeout applies to all providers
+    :param spiders: several spider accounts among which the test accounts are split; defaults to spac only
+    :param limits: if given, check the SMTP SIZE limits and quotas before sending, and cache them here
+    :param skip: whether test accounts whose file can not arrive are skipped, or only marked in the output
     """
+    if deadlines is None:
+        deadlines = Deadlines({}, timeout)
+    assigned = assign_spiders(output, spiders or [spac], accounts)
+    doomed = {}
+    if limits is not None:
+        with span("pre-flight checks"):
+            doomed = preflightcheck(output, accounts, assigned, testfile, limits)
+    if skip:
+        for addr, reason in doomed.items():
+            print("%s: skipped - %s" % (addr, reason))
+            output.submit_filetest_result(addr, "skipped: " + reason, [])
     # send file test
     print("Sending %s test file to spider from all accounts:" % (get_file_size(testfile),))
     begin = time.time()
-    messages_to_wait = [send_test_file(spac, ac, testfile) for ac in accounts]
+    with span("send test files"):
+        messages_to_wait = [send_test_file(assigned[ac.get_config("addr")], ac, testfile) for ac in accounts
+                            if not skip or ac.get_config("addr") not in doomed]
     # wait until finished, or timeout
     try:
-        while time.time() < begin + timeout:
-            if output.filetest_completed.wait(timeout=1):
-                break
-            messages = []
-            for msg in messages_to_wait:
-                if msg.is_out_delivered():
-                    continue
-                elif msg.is_out_failed():
-                    addr = msg.account.get_config("addr")
-                    reason = parse_msg(msg.get_message_info()).get("error")
-                    if reason is None:
-                        reason = "unspecified msg.error - see log output"
-                    print("%s: sending failed - %s" % (addr, reason))
-                    output.submit_filetest_result(addr, reason, [])
-                else:
-                    messages.append(msg)
-            messages_to_wait = messages
+        with reporter.watch(output, "file", deadlines.get_longest(output.accounts) - (time.time() - begin),
+                            deadlines, begin):
+            while not deadlines.is_over(output.get_outstanding(), begin):
+                if output.filetest_completed.wait(timeout=1):
+                    break
+                messages = []
+                for msg in messages_to_wait:
+                    if msg.is_out_delivered():
+                        continue
+                    elif msg.is_out_failed():
+                        addr = msg.account.get_config("addr")
+                        reason = parse_msg(msg.get_message_info()).get("error")
+                        if reason is None:
+                            reason = "unspecified msg.error - see log output"
+                        print("%s: sending failed - %s" % (addr, reason))
+                        output.submit_filetest_result(addr, reason, [])
+                    else:
+                        messages.append(msg)
+                messages_to_wait = messages
     except KeyboardInterrupt:
         print("Test interrupted. File test sending failed for: ")
         for ac in accounts:
@@ -140,14 +209,397 @@ def filetest(spac: deltachat.Account, output, accounts: [deltachat.Account], tim
                 print("%s: %s" % (addr, output.sending.get(addr)))
             except TypeError:
                 print("%s: timeout" % (addr,))
-    if time.time() >= begin + timeout:
+    if not output.filetest_completed.is_set():
         print("Timeout reached. File sending test failed for")
         for ac in accounts:
             if ac.get_self_contact().addr not in output.sending:
                 print(ac.get_self_contact().addr)
+    tracer.add_span("wait for test files", "main", begin, time.time())
+    with span("download test files"):
+        for spider in spiders or [spac]:
+            senders = [addr for addr, sp in assigned.items() if sp is spider]
+            downloadtest(spider, output, senders)
+
+
+def preflightcheck(output, accounts: [deltachat.Account], assigned: {str: deltachat.Account}, testfile: str,
+                   limits: LimitsCache) -> {str: str}:
+    """Find out which test accounts can not send the test file to their spider at all, because it is larger
+    than the SIZE limit of their SMTP server, or than the free storage of their mailbox or the spider's.
+
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param assigned: the spider of each test account, by email address
+    :param testfile: absolute path to the test file
+    :param limits: the cache of the SMTP SIZE limits, which are checked again when they expired
+    :return: the reasons why the file can not arrive, by email address of the test account
+    """
+    size = estimate_message_size(os.path.getsize(testfile))
+    spider_quotas = {}
+    doomed = {}
+    for ac in accounts:
+        addr = ac.get_config("addr")
+        spider = assigned[addr]
+        if spider.get_config("addr") not in spider_quotas:
+            spider_quotas[spider.get_config("addr")] = get_quota_free(spider)
+        reason = check_limits(size, get_smtp_size(ac, limits), get_quota_free(ac),
+                              spider_quotas[spider.get_config("addr")])
+        output.submit_preflight_result(addr, reason)
+        if reason is not None:
+            doomed[addr] = reason
+    limits.save()
+    return doomed
+
+
+def get_smtp_size(ac: deltachat.Account, limits: LimitsCache) -> int:
+    """Return the SMTP SIZE limit of the provider of an account. It is taken from the cache, unless it expired.
+
+    :param ac: the test account
+    :param limits: the cache of the SMTP SIZE limits
+    :return: the SIZE limit in bytes, or None if the server does not announce it
+    """
+    addr = ac.get_config("addr")
+    sizekey = "size:" + addr.split("@")[1]
+    if limits.get(sizekey) is None:
+        try:
+            smtpconn = get_smtpconn(ac)
+            smtp_size = smtpconn.esmtp_features.get("size", "").strip()
+            limits.set(sizekey, int(smtp_size) if smtp_size.isdigit() else None)
+            close_conn(smtpconn)
+        except (smtplib.SMTPException, socket.error, ValueError) as e:
+            print("[ERROR] %s: could not check the SMTP SIZE limit: %s" % (addr, e))
+    return (limits.get(sizekey) or {}).get("value")
+
 
+def get_quota_free(ac: deltachat.Account) -> int:
+    """Return how much storage is free in the mailbox of an account. It is not cached, as the mailboxes fill up
+    during a sweep of file sizes.
 
-def recipientstest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, recipient_nums: [int]):
+    :param ac: the test or spider account
+    :return: the free storage in bytes, or None if the server does not announce a quota
+    """
+    addr = ac.get_config("addr")
+    try:
+        imapconn = get_imapconn(ac)
+        quota_free = None
+        if imapconn.has_capability("QUOTA"):
+            for quota in imapconn.get_quota():
+                if quota.resource.upper() == "STORAGE":
+                    # STORAGE quotas are counted in KB
+                    quota_free = (quota.limit - quota.usage) * 1024
+        imapconn.logout()
+        return quota_free
+    except (imapclient.exceptions.IMAPClientError, socket.error, ValueError) as e:
+        print("[ERROR] %s: could not check the IMAP quota: %s" % (addr, e))
+        return None
+
+
+def assign_spiders(output, spiders: [deltachat.Account], accounts: [deltachat.Account]) -> {str: deltachat.Account}:
+    """Split the test accounts among the spiders, so a single spider mailbox does not limit the measurements.
+    Test accounts are assigned in turn to the spiders at other providers than their own, if there are any.
+
+    :param output: Output object which gathers the test results
+    :param spiders: the spider accounts
+    :param accounts: test accounts
+    :return: the spider of each test account, by email address
+    """
+    assigned = {}
+    for i, ac in enumerate(accounts):
+        addr = ac.get_config("addr")
+        candidates = [sp for sp in spiders
+                      if sp.get_config("addr").split("@")[1] != addr.split("@")[1]] or spiders
+        assigned[addr] = candidates[i % len(candidates)]
+        output.submit_spider_assignment(addr, assigned[addr].get_config("addr"))
+    return assigned
+
+
+def downloadtest(spac: deltachat.Account, output, senders: [str] = None):
+    """Download the received test files from the spider's IMAP server, with and without COMPRESS=DEFLATE.
+
+    :param spac: spider account which received the test files
+    :param output: Output object which gathers the test results
+    :param senders: the email addresses whose test files the spider received; defaults to all
+    """
+    message_ids = [(addr, message_id) for addr, message_id in output.message_ids.items()
+                   if senders is None or addr in senders]
+    if not message_ids:
+        return
+    for mode in ("plain", "deflate"):
+        try:
+            imapconn = get_imapconn(spac)
+        except (socket.error, imapclient.exceptions.IMAPClientError) as e:
+            print("Could not connect to the spider's IMAP server: %s" % (e,))
+            return
+        try:
+            if mode == "deflate":
+                if not imapconn.has_capability("COMPRESS=DEFLATE"):
+                    for addr, _ in message_ids:
+                        output.submit_download_result(addr, mode, "not supported")
+                    imapconn.logout()
+                    continue
+                reader = enable_compression(imapconn)
+            else:
+                reader = count_bytes(imapconn)
+            imapconn.select_folder("INBOX", readonly=True)
+        except (imapclient.exceptions.IMAPClientError, socket.error) as e:
+            for addr, _ in message_ids:
+                output.submit_download_result(addr, mode, str(e))
+            close_conn(imapconn)
+            continue
+        for addr, message_id in message_ids:
+            try:
+                with span("download test file", addr, mode=mode):
+                    size, duration, wire_bytes = download_message(imapconn, message_id, reader)
+            except LookupError:
+                output.submit_download_result(addr, mode, "not found")
+                continue
+            except (imapclient.exceptions.IMAPClientError, socket.error) as e:
+                output.submit_download_result(addr, mode, str(e))
+                continue
+            if size == 0 or duration <= 0:
+                # the clock is too coarse for the download, so there is no meaningful throughput
+                output.submit_download_result(addr, mode, "", wire_bytes)
+                continue
+            throughput = size / duration / (1024 * 1024)
+            print("%s: spider downloaded test file in %.1f seconds (%.2f MB/s, %s bytes on the wire, %s)" %
+                  (addr, duration, throughput, wire_bytes, mode))
+            output.submit_download_result(addr, mode, "%.2f" % (throughput,), wire_bytes)
+        close_conn(imapconn)
+
+
+def download_message(imapconn: imapclient.IMAPClient, message_id: str, reader) -> (int, float, int):
+    """Fetch a complete message from the selected folder and measure how long it took.
+
+    :param imapconn: the IMAP connection, with a folder selected
+    :param message_id: the Message-ID header of the message
+    :param reader: the DeflateReader or CountingReader of the connection, which counts the bytes on the wire
+    :return: the size of the message in bytes, the seconds the FETCH took, and how many bytes the server sent for it
+    """
+    uids = imapconn.search(["HEADER", "Message-ID", message_id])
+    if not uids:
+        raise LookupError("no message with Message-ID %s" % (message_id,))
+    uid = uids[-1]
+    wire_bytes = reader.wire_bytes
+    begin = time.time()
+    response = imapconn.fetch([uid], ["BODY.PEEK[]"])
+    duration = time.time() - begin
+    return len(response[uid][b"BODY[]"]), duration, reader.wire_bytes - wire_bytes
+
+
+def idletest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, repetitions: int):
+    """Hold IDLE open on all test accounts, send them messages from the spider, and measure the push delay.
+
+    :param spac: spider account which sends the messages over SMTP
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param timeout: timeout in seconds for each injection
+    :param repetitions: how many messages are sent to each test account
+    """
+    imapconns = {}
+    for ac in accounts:
+        try:
+            imapconns[ac.get_config("addr")] = get_imapconn(ac)
+        except (socket.error, imapclient.exceptions.IMAPClientError) as e:
+            print("Could not connect to %s: %s" % (ac.get_config("configured_mail_server"), e))
+    smtpconn = None
+    for i in range(repetitions):
+        print("IDLE test round %s of %s" % (i + 1, repetitions))
+        begin = time.time()
+        results = {}
+        threads = []
+        message_ids = {}
+        accepted = {}
+        try:
+            for addr, imapconn in imapconns.items():
+                message_ids[addr] = make_msgid()
+                ready = threading.Event()
+                t = threading.Thread(target=wait_for_idle_push, daemon=True,
+                                     args=(imapconn, message_ids[addr], ready, timeout, results.setdefault(addr, {})))
+                t.start()
+                ready.wait(timeout=timeout)
+                threads.append(t)
+            for addr in imapconns:
+                msg = MIMEText("Begin: %s\nTest: idle" % (time.time(),))
+                msg["Subject"] = "IDLE Test %s" % (i,)
+                msg["To"] = addr
+                msg["From"] = spac.get_config("addr")
+                msg["Message-ID"] = message_ids[addr]
+                try:
+                    if smtpconn is None:
+                        smtpconn = get_smtpconn(spac)
+                    smtpconn.send_message(msg)
+                    accepted[addr] = time.time()
+                except (smtplib.SMTPException, socket.error, ValueError) as e:
+                    # e.g. the spider's provider throttles; the next injection opens a new connection
+                    accepted[addr] = "could not send: %s" % (e,)
+                    if smtpconn is not None:
+                        close_conn(smtpconn)
+                        smtpconn = None
+        finally:
+            for t in threads:
+                t.join()
+        tracer.add_span("idle round", "main", begin, time.time(), {"round": i + 1})
+        for addr in imapconns:
+            times = results[addr]
+            if isinstance(accepted[addr], str):
+                output.submit_idle_result(addr, accepted[addr], accepted[addr])
+                continue
+            if "error" in times:
+                output.submit_idle_result(addr, times["error"], times["error"])
+                continue
+            woken = times.get("woken")
+            fetched = times.get("fetched")
+            output.submit_idle_result(addr,
+                                      woken - accepted[addr] if woken else "timeout",
+                                      fetched - accepted[addr] if fetched else "timeout")
+    if smtpconn is not None:
+        close_conn(smtpconn)
+    for imapconn in imapconns.values():
+        close_conn(imapconn)
+
+
+def wait_for_idle_push(imapconn: imapclient.IMAPClient, message_id: str, ready: threading.Event,
+                       timeout: int, times: dict):
+    """IDLE on the INBOX until a message arrived, then fetch it. Runs in a background thread.
+
+    :param imapconn: the IMAP connection of the test account
+    :param message_id: the Message-ID of the message which is awaited
+    :param ready: is set as soon as the connection is in IDLE
+    :param timeout: seconds after which the test is aborted
+    :param times: dictionary which is filled with the "woken" and "fetched" timestamps, or an "error"
+    """
+    try:
+        imapconn.select_folder("INBOX")
+        imapconn.idle()
+        ready.set()
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            responses = imapconn.idle_check(timeout=deadline - time.time())
+            if not any(resp[1] == b"EXISTS" for resp in responses if len(resp) > 1):
+                continue
+            woken = time.time()
+            imapconn.idle_done()
+            uids = imapconn.search(["HEADER", "Message-ID", message_id])
+            if uids:
+                times["woken"] = woken
+                imapconn.fetch(uids, ["BODY.PEEK[]"])
+                times["fetched"] = time.time()
+                return
+            imapconn.idle()  # some other message arrived
+        imapconn.idle_done()
+    except (socket.error, imapclient.exceptions.IMAPClientError) as e:
+        times["error"] = str(e)
+    finally:
+        ready.set()
+
+
+def throughputtest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, rates: [int],
+                   step_seconds: int = 60, spiders: [deltachat.Account] = None):
+    """All test accounts send messages to the spider at increasing rates, until the provider starts to refuse them.
+
+    :param spac: spider account to which the messages are sent
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param timeout: seconds to wait for outstanding deliveries after sending finished
+    :param rates: the messages per minute of each step of the ramp
+    :param step_seconds: how long each step of the ramp lasts
+    :param spiders: several spider accounts among which the test accounts are split; defaults to spac only
+    """
+    print("Throughput test with %d accounts, rates per minute: %s" % (len(accounts), rates))
+    assigned = assign_spiders(output, spiders or [spac], accounts)
+    threads = []
+    for ac in accounts:
+        t = threading.Thread(target=send_throughput_ramp,
+                             args=(assigned[ac.get_config("addr")], ac, output, rates, step_seconds))
+        t.start()
+        threads.append(t)
+    try:
+        with span("send throughput ramps"):
+            for t in threads:
+                t.join()
+        print("Sending finished, waiting up to %s seconds for outstanding messages" % (timeout,))
+        output.finish_throughput_sending()
+        with span("wait for throughput messages"):
+            output.throughput_completed.wait(timeout=timeout)
+    except KeyboardInterrupt:
+        print("Test interrupted.")
+
+
+def send_throughput_ramp(spac: deltachat.Account, ac: deltachat.Account, output, rates: [int], step_seconds: int):
+    """Send messages over SMTP at increasing rates. Stops at the first message the server refuses or defers, or when
+    the connection fails.
+
+    :param spac: spider account to which the messages are sent
+    :param ac: the test account which sends the messages
+    :param output: Output object which gathers the test results
+    :param rates: the messages per minute of each step of the ramp
+    :param step_seconds: how long each step of the ramp lasts
+    """
+    addr = ac.get_config("addr")
+    try:
+        smtpconn = get_smtpconn(ac)
+    except (smtplib.SMTPException, socket.error, ValueError) as e:
+        output.submit_throughput_failed(addr, 0, str(e))
+        return
+    try:
+        for rate in rates:
+            with span("throughput step", addr, rate=rate):
+                if not send_throughput_step(spac, smtpconn, addr, output, rate, step_seconds):
+                    return
+    finally:
+        # throttled accounts still have an open connection
+        close_conn(smtpconn)
+
+
+def send_throughput_step(spac: deltachat.Account, smtpconn: smtplib.SMTP_SSL, addr: str, output, rate: int,
+                         step_seconds: int) -> bool:
+    """Send messages at a constant rate for one step of the throughput ramp.
+
+    :param spac: spider account to which the messages are sent
+    :param smtpconn: the SMTP connection of the test account
+    :param addr: the email address of the test account
+    :param output: Output object which gathers the test results
+    :param rate: messages per minute, greater than 0
+    :param step_seconds: how long the step lasts
+    :return: False if the SMTP server refused or deferred a message, or the connection failed
+    """
+    interval = 60 / rate
+    begin = time.time()
+    for seq in range(max(1, round(rate * step_seconds / 60))):
+        time.sleep(max(0.0, begin + seq * interval - time.time()))
+        msg = MIMEText("eppdperf throughput test\nTest: throughput\nRate: %s\nSeq: %s" % (rate, seq))
+        msg["Subject"] = "Throughput Test %s/min" % (rate,)
+        msg["To"] = spac.get_config("addr")
+        msg["From"] = addr
+        try:
+            smtpconn.send_message(msg)
+        except (smtplib.SMTPException, socket.error) as e:
+            if is_temporary_failure(e):
+                output.submit_throughput_throttled(addr, rate, str(e))
+            else:
+                output.submit_throughput_failed(addr, rate, str(e))
+            return False
+        output.submit_throughput_accepted(addr, rate, seq, time.time())
+    return True
+
+
+def is_temporary_failure(e: Exception) -> bool:
+    """Whether an SMTP error is a 4xx reply like 421, 450, or 451, with which servers defer messages when they rate
+    limit. 5xx replies are permanent failures, and dropped connections have no reply code at all.
+
+    :param e: the exception smtplib raised
+    :return: True if the server deferred the message
+    """
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in e.recipients.values()]
+    elif isinstance(e, smtplib.SMTPResponseException):
+        codes = [e.smtp_code]
+    else:
+        return False
+    return bool(codes) and all(400 <= code < 500 for code in codes)
+
+
+def recipientstest(spac: deltachat.Account, output, accounts: [deltachat.Account], timeout: int, recipient_nums: [int],
+                   probe=False, spiders: [deltachat.Account] = None):
     """Try to write messages to 5,10,15,25,30,35,40,45,50,55... recipients to find out the limit.
 
     :param spac: spider account to which the messages are addressed
@@ -155,15 +607,35 @@ def recipientstest(spac: deltachat.Account, output, accounts: [deltachat.Account
     :param accounts: test accounts
     :param timeout: timeout in seconds
     :param maximum: the maximum recipients to try out
+    :param probe: only send RCPT TO commands for the maximum number of recipients, and no message
+    :param spiders: several spider accounts among which the test accounts are split; defaults to spac only
     """
     os.system("date")
     print("Recipient Test with %d accounts, steps: %s" % (
           len(accounts), recipient_nums))
+    assigned = assign_spiders(output, spiders or [spac], accounts)
     for ac in accounts:
+        spac = assigned[ac.get_config("addr")]
         smtpconn = get_smtpconn(ac)
+        if probe:
+            try:
+                with span("probe recipients", ac.get_config("addr"), recipients=max(recipient_nums)):
+                    accepted = probe_recipients(smtpconn, spac, ac, max(recipient_nums))
+            except (smtplib.SMTPException, socket.error) as e:
+                print("[%s] Probing recipients failed: %s" % (ac.get_config("addr"), str(e)))
+                continue
+            finally:
+                try:
+                    close_conn(smtpconn)
+                except (smtplib.SMTPException, socket.error):
+                    pass  # the server may already have closed the connection
+            print("[%s] Server accepted %s of %s recipients" % (ac.get_config("addr"), accepted, max(recipient_nums)))
+            output.submit_recipients_result(ac.get_config("addr"), str(accepted))
+            continue
         for num in recipient_nums:
             try:
-                send_smtp_msg(smtpconn, spac, ac, num)
+                with span("send to recipients", ac.get_config("addr"), recipients=num):
+                    send_smtp_msg(smtpconn, spac, ac, num)
             except smtplib.SMTPDataError as e:
                 print("[%s] Sending message to %s recipients failed: %s" % (ac.get_config("addr"), num, str(e)))
                 break
@@ -172,20 +644,22 @@ def recipientstest(spac: deltachat.Account, output, accounts: [deltachat.Account
                 output.submit_recipients_result(ac.get_config("addr"), str(num))
 
 
-def get_smtpconn(ac: deltachat.Account) -> smtplib.SMTP_SSL:
+def get_smtpconn(ac: deltachat.Account, context: ssl.SSLContext = None) -> smtplib.SMTP_SSL:
     """Get a SMTP connection
 
     :param ac: the test account
+    :param context: the SSL context for the connection, e.g. to resume TLS sessions
     :return: the SMTP connection
     """
     print("Trying to login to %s" % (ac.get_config("addr"),))
     host = ac.get_config("configured_send_server")
     port = int(ac.get_config("configured_send_port"))
     if ac.get_config("configured_send_security") == "1":
-        smtpconn = smtplib.SMTP_SSL(host, port)
+        smtpconn = smtplib.SMTP_SSL(host, port, context=context)
     elif ac.get_config("configured_send_security") == "2":
         smtpconn = smtplib.SMTP(host, port)
-        context = ssl.create_default_context()
+        if context is None:
+            context = ssl.create_default_context()
         smtpconn.starttls(context=context)
         smtpconn.ehlo()
     else:
@@ -195,6 +669,354 @@ def get_smtpconn(ac: deltachat.Account) -> smtplib.SMTP_SSL:
     return smtpconn
 
 
+def get_imapconn(ac: deltachat.Account, context: ssl.SSLContext = None) -> imapclient.IMAPClient:
+    """Get an IMAP connection with the configured settings of an account
+
+    :param ac: the test account
+    :param context: the SSL context for the connection, e.g. to resume TLS sessions
+    :return: the logged in IMAP connection
+    """
+    host = ac.get_config("configured_mail_server")
+    port = int(ac.get_config("configured_mail_port"))
+    if ac.get_config("configured_mail_security") == "1":
+        imapconn = imapclient.IMAPClient(host=host, port=port, ssl_context=context)
+    elif ac.get_config("configured_mail_security") == "2":
+        imapconn = imapclient.IMAPClient(host=host, port=port, ssl=False)
+        imapconn.starttls(context or ssl.create_default_context())
+    else:
+        raise ValueError("Failed to connect: can not determine configured_mail_security %s for %s" %
+                         (ac.get_config("configured_mail_security"), ac.get_config("addr")))
+    imapconn.login(ac.get_config("addr"), ac.get_config("mail_pw"))
+    return imapconn
+
+
+class ResumingContext(ssl.SSLContext):
+    """SSL context which resumes the TLS session of the previous connection.
+
+    After a connection was established, store its session in the session attribute.
+    """
+
+    def __new__(cls):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self):
+        self.load_default_certs()
+        self.session = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        kwargs.setdefault("session", self.session)
+        return super().wrap_socket(sock, *args, **kwargs)
+
+
+def reconnecttest(output, accounts: [deltachat.Account], repetitions: int, parallel: int = 1):
+    """Measure how long it takes to connect and log in to IMAP and SMTP: cold, with a resumed TLS session, and
+    compared to a NOOP on a long-lived connection.
+
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param repetitions: how many connections are measured for each account, protocol, and mode
+    :param parallel: how many accounts are tested at the same time
+    """
+    def measure_reconnects(ac: deltachat.Account):
+        addr = ac.get_config("addr")
+        for protocol in ("IMAP", "SMTP"):
+            print("%s: measuring %s reconnects" % (addr, protocol))
+            resuming = ResumingContext()
+            try:
+                with span("%s reconnects" % (protocol,), addr):
+                    for i in range(repetitions):
+                        duration, _ = measure_connect(ac, protocol, ssl.create_default_context())
+                        output.submit_reconnect_result(addr, protocol, "cold", duration)
+                        duration, reused = measure_connect(ac, protocol, resuming)
+                        # the first connection can not resume a session yet
+                        if i > 0:
+                            output.submit_reconnect_result(addr, protocol, "warm", duration, reused)
+                    conn = get_imapconn(ac) if protocol == "IMAP" else get_smtpconn(ac)
+                    for i in range(repetitions):
+                        begin = time.time()
+                        conn.noop()
+                        output.submit_reconnect_result(addr, protocol, "reused", time.time() - begin)
+                    close_conn(conn)
+            except (smtplib.SMTPException, imapclient.exceptions.IMAPClientError, socket.error, ValueError) as e:
+                print("[ERROR] %s: %s reconnect test failed: %s" % (addr, protocol, e))
+
+    for_each_account(measure_reconnects, accounts, parallel)
+
+
+def measure_connect(ac: deltachat.Account, protocol: str, context: ssl.SSLContext) -> (float, bool):
+    """Connect and log in to the IMAP or SMTP server of an account, and log out again.
+
+    :param ac: the test account
+    :param protocol: "IMAP" or "SMTP"
+    :param context: the SSL context for the connection; a ResumingContext gets the new session
+    :return: seconds until the login finished, and whether the TLS session was resumed
+    """
+    begin = time.time()
+    if protocol == "IMAP":
+        conn = get_imapconn(ac, context)
+        sock = conn._imap.sock
+    else:
+        conn = get_smtpconn(ac, context)
+        sock = conn.sock
+    duration = time.time() - begin
+    reused = getattr(sock, "session_reused", False)
+    if isinstance(context, ResumingContext):
+        context.session = sock.session
+    close_conn(conn)
+    return duration, reused
+
+
+def close_conn(conn):
+    """Log out of an IMAP or SMTP connection. Errors are ignored, as the connection may already be broken.
+
+    :param conn: an imapclient.IMAPClient or smtplib.SMTP connection
+    """
+    try:
+        if isinstance(conn, imapclient.IMAPClient):
+            conn.logout()
+        else:
+            conn.quit()
+    except (smtplib.SMTPException, imapclient.exceptions.IMAPClientError, socket.error):
+        pass
+
+
+class DeflateReader(io.RawIOBase):
+    """Decompress the data an IMAP server sends after COMPRESS=DEFLATE was enabled.
+
+    :param sock: the socket of the IMAP connection
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.pending = b""
+        self.wire_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.pending:
+            data = self.sock.recv(65536)
+            if not data:
+                return 0
+            self.wire_bytes += len(data)
+            self.pending = self.decompressor.decompress(data)
+        n = min(len(b), len(self.pending))
+        b[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+def enable_compression(imapconn: imapclient.IMAPClient) -> DeflateReader:
+    """Enable COMPRESS=DEFLATE (RFC 4978) on an IMAP connection.
+
+    :param imapconn: the IMAP connection; the server must support COMPRESS=DEFLATE
+    :return: the reader which decompresses the server responses and counts the compressed bytes
+    """
+    imaplib.Commands.setdefault("COMPRESS", ("AUTH", "SELECTED"))
+    imap = imapconn._imap
+    typ, data = imap._simple_command("COMPRESS", "DEFLATE")
+    if typ != "OK":
+        raise imapclient.exceptions.IMAPClientError("COMPRESS DEFLATE failed: %s" % (data,))
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    sock = imap.sock
+
+    def send(data):
+        sock.sendall(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH))
+
+    reader = DeflateReader(sock)
+    imap.send = send
+    imap.file = io.BufferedReader(reader)
+    return reader
+
+
+class CountingReader(io.RawIOBase):
+    """Count the bytes an IMAP server sends over an uncompressed connection.
+
+    :param sock: the socket of the IMAP connection
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.wire_bytes = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.sock.recv_into(b)
+        self.wire_bytes += n
+        return n
+
+
+def count_bytes(imapconn: imapclient.IMAPClient) -> CountingReader:
+    """Count the bytes the server sends on an IMAP connection from now on.
+
+    :param imapconn: the IMAP connection
+    :return: the reader which counts the bytes in its wire_bytes attribute
+    """
+    reader = CountingReader(imapconn._imap.sock)
+    imapconn._imap.file = io.BufferedReader(reader)
+    return reader
+
+
+SYNC_FOLDER = "eppdperf-sync"
+SYNC_MODES = ("full", "CONDSTORE", "QRESYNC")
+
+
+def synctest(output, accounts: [deltachat.Account], messages: int, changes: int, parallel: int = 1):
+    """Measure how long a client takes to resync a folder, and how many bytes it downloads: fetching the flags of
+    all messages, compared to fetching only the changed ones with CONDSTORE or QRESYNC, each with and without
+    COMPRESS=DEFLATE.
+
+    :param output: Output object which gathers the test results
+    :param accounts: test accounts
+    :param messages: how many messages the test folder contains
+    :param changes: how many messages are flagged as seen before the resync
+    :param parallel: how many accounts are tested at the same time
+    """
+    def measure_sync(ac: deltachat.Account):
+        addr = ac.get_config("addr")
+        try:
+            with span("fill sync folder", addr, messages=messages):
+                uidvalidity, modseq = fill_sync_folder(ac, messages, changes)
+        except (imapclient.exceptions.IMAPClientError, socket.error, ValueError) as e:
+            print("[ERROR] %s: could not prepare the sync test folder: %s" % (addr, e))
+            return
+        for mode in SYNC_MODES:
+            for compression in ("plain", "deflate"):
+                try:
+                    with span("%s resync" % (mode,), addr, compression=compression):
+                        result = measure_resync(ac, mode, compression, uidvalidity, modseq)
+                except (imapclient.exceptions.IMAPClientError, socket.error) as e:
+                    result = str(e)
+                output.submit_sync_result(addr, mode, compression, result)
+        try:
+            imapconn = get_imapconn(ac)
+            imapconn.delete_folder(SYNC_FOLDER)
+            imapconn.logout()
+        except (imapclient.exceptions.IMAPClientError, socket.error) as e:
+            print("[ERROR] %s: could not delete the sync test folder: %s" % (addr, e))
+
+    for_each_account(measure_sync, accounts, parallel)
+
+
+def fill_sync_folder(ac: deltachat.Account, messages: int, changes: int) -> (int, int):
+    """Create the sync test folder with the given number of messages, remember its state as a client would, and
+    then change the flags of some messages.
+
+    :param ac: the test account
+    :param messages: how many messages are appended to the folder
+    :param changes: how many messages are flagged as seen afterwards
+    :return: the UIDVALIDITY of the folder, and its HIGHESTMODSEQ before the flag changes, or 0 without CONDSTORE
+    """
+    imapconn = get_imapconn(ac)
+    if imapconn.folder_exists(SYNC_FOLDER):
+        imapconn.delete_folder(SYNC_FOLDER)
+    imapconn.create_folder(SYNC_FOLDER)
+    for i in range(messages):
+        msg = MIMEText("Sync test message %s" % (i,))
+        msg["Subject"] = "Sync test %s" % (i,)
+        msg["From"] = ac.get_config("addr")
+        msg["To"] = ac.get_config("addr")
+        msg["Message-ID"] = make_msgid()
+        imapconn.append(SYNC_FOLDER, msg.as_bytes())
+    # servers which support CONDSTORE announce the HIGHESTMODSEQ when the folder is selected
+    status = imapconn.select_folder(SYNC_FOLDER)
+    uidvalidity = int(status[b"UIDVALIDITY"])
+    modseq = int(status.get(b"HIGHESTMODSEQ", 0))
+    uids = imapconn.search("ALL")
+    imapconn.add_flags(uids[:changes], [imapclient.SEEN])
+    imapconn.logout()
+    return uidvalidity, modseq
+
+
+def measure_resync(ac: deltachat.Account, mode: str, compression: str, uidvalidity: int, modseq: int):
+    """Resync the sync test folder on a new connection, like a client which was offline during the flag changes.
+
+    :param ac: the test account
+    :param mode: one of SYNC_MODES
+    :param compression: "plain" or "deflate", whether COMPRESS=DEFLATE is enabled
+    :param uidvalidity: the UIDVALIDITY of the folder the client remembers
+    :param modseq: the HIGHESTMODSEQ of the folder the client remembers
+    :return: seconds the resync took and the bytes the server sent, or "not supported"
+    """
+    imapconn = get_imapconn(ac)
+    try:
+        if mode != "full" and (not imapconn.has_capability(mode) or modseq == 0):
+            return "not supported"
+        if compression == "deflate":
+            if not imapconn.has_capability("COMPRESS=DEFLATE"):
+                return "not supported"
+            reader = enable_compression(imapconn)
+        else:
+            reader = count_bytes(imapconn)
+        if mode == "QRESYNC":
+            imapconn.enable(mode)
+        wire_bytes = reader.wire_bytes
+        begin = time.time()
+        if mode == "QRESYNC":
+            # imapclient can not pass the QRESYNC parameter to SELECT, so the changes come as untagged responses
+            imap = imapconn._imap
+            typ, data = imap._simple_command("SELECT", "%s (QRESYNC (%s %s))" % (SYNC_FOLDER, uidvalidity, modseq))
+            if typ != "OK":
+                raise imapclient.exceptions.IMAPClientError("SELECT QRESYNC failed: %s" % (data,))
+            imap.untagged_responses.clear()
+        else:
+            imapconn.select_folder(SYNC_FOLDER)
+            modifiers = ["CHANGEDSINCE %s" % (modseq,)] if mode == "CONDSTORE" else None
+            imapconn.fetch("1:*", ["UID", "FLAGS"], modifiers=modifiers)
+        duration = time.time() - begin
+        return duration, reader.wire_bytes - wire_bytes
+    finally:
+        imapconn.logout()
+
+
+def probe_recipients(smtpconn: smtplib.SMTP_SSL, spac: deltachat.Account, ac: deltachat.Account, num: int) -> int:
+    """Find out how many recipients the SMTP server accepts for one message, without sending it. If the server
+    supports PIPELINING, all RCPT TO commands are sent at once; the transaction is then aborted with RSET.
+
+    :param smtpconn: the logged in SMTP connection
+    :param spac: spider account to whose subaddresses the RCPT TO commands are addressed
+    :param ac: the test account which is the sender
+    :param num: how many recipients are tried at most
+    :return: how many recipients the server accepted before it rejected the first one
+    """
+    smtpconn.ehlo_or_helo_if_needed()
+    localpart, _, domain = spac.get_config("addr").partition("@")
+    recipients = ["%s+%s@%s" % (localpart, i, domain) for i in range(num)]
+    sender = ac.get_config("addr")
+    accepted = 0
+    if smtpconn.has_extn("pipelining"):
+        commands = ["MAIL FROM:<%s>\r\n" % (sender,)] + ["RCPT TO:<%s>\r\n" % (rcpt,) for rcpt in recipients]
+        smtpconn.send("".join(commands))
+        code, message = smtpconn.getreply()
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, message, sender)
+        rejected = False
+        for _ in recipients:
+            try:
+                code, _ = smtpconn.getreply()
+            except smtplib.SMTPServerDisconnected:
+                return accepted  # some servers close the connection when there are too many recipients
+            if code in (250, 251) and not rejected:
+                accepted += 1
+            else:
+                rejected = True  # the replies to the remaining RCPT TO commands still need to be read
+    else:
+        code, message = smtpconn.mail(sender)
+        if code != 250:
+            raise smtplib.SMTPSenderRefused(code, message, sender)
+        for rcpt in recipients:
+            code, _ = smtpconn.rcpt(rcpt)
+            if code not in (250, 251):
+                break
+            accepted += 1
+    smtpconn.rset()
+    return accepted
+
+
 def send_smtp_msg(smtpconn: smtplib.SMTP_SSL, spac: deltachat.Account, ac: deltachat.Account, num: int):
     """Send a test message over an SMTP connection
 
@@ -212,20 +1034,23 @@ def send_smtp_msg(smtpconn: smtplib.SMTP_SSL, spac: deltachat.Account, ac: delta
     smtpconn.send_message(msg)
 
 
-def featurestest(output, accounts: [deltachat.Account]):
+def featurestest(output, accounts: [deltachat.Account], parallel: int = 1):
     """Find out the IMAP Quota for all test accounts
 
     :param output: Output object which gathers the test results
     :param accounts: test accounts
+    :param parallel: how many accounts are tested at the same time
     """
-    for ac in accounts:
+    def check_features(ac: deltachat.Account):
+        begin = time.time()
         try:
             imapconn = imapclient.IMAPClient(host=ac.get_config("configured_mail_server"))
         except socket.gaierror:
             print("Could not connect to " + ac.get_config("configured_mail_server"))
-            continue
+            return
         imapconn.login(ac.get_config("addr"), ac.get_config("mail_pw"))
         results = [x.decode("ascii") for x in imapconn.capabilities()]
+        tracer.add_span("IMAP login and capabilities", ac.get_config("addr"), begin, time.time())
         for cond in TESTED_CAPABILITIES:
             output.submit_capability_result(ac.get_config("addr"), cond, cond in results)
 
@@ -234,7 +1059,7 @@ def featurestest(output, accounts: [deltachat.Account]):
                 quotaint = imapconn.get_quota()[0].limit
             except IndexError:
                 output.submit_quota_result(ac.get_config("addr"), "Server Error")
-                continue
+                return
             if quotaint > 1024 * 1024:
                 quota = str(round(quotaint / (1024 * 1024), 3)) + "GB"
             else:
@@ -243,50 +1068,74 @@ def featurestest(output, accounts: [deltachat.Account]):
         else:
             output.submit_quota_result(ac.get_config("addr"), "Not Supported")
 
+    for_each_account(check_features, accounts, parallel)
+
 
-def shutdown_accounts(args, accounts: [deltachat.Account], spac: deltachat.Account):
+def shutdown_accounts(args, accounts: [deltachat.Account], spiders: [deltachat.Account]):
     """Shut down all DeltaChat accounts and wait until its done.
 
     :param args: command line arguments
     :param accounts: the test accounts
-    :param spac: the spider account
+    :param spiders: the spider accounts
     """
-    for ac in accounts:
-        ac.shutdown()
-    if not args.yes:
-        answer = input("Do you want to delete all messages in the %s account? [y/N]" % (spac.get_config("addr"),))
-        if answer.lower() == "y":
-            for chat in spac.get_chats():
-                spac.delete_messages(chat.get_messages())
-    else:
-        print("deleting all messages in the %s account..." % (spac.get_config("addr"),))
-        for chat in spac.get_chats():
-            messages = chat.get_messages()
-            if messages:
-                spac.delete_messages(messages)
-    spac.shutdown()
-    for ac in accounts:
-        ac.wait_shutdown()
-    spac.wait_shutdown()
+    with span("shut down test accounts"):
+        for ac in accounts:
+            ac.shutdown()
+    for spac in spiders:
+        if not args.yes:
+            answer = input("Do you want to delete all messages in the %s account? [y/N]" % (spac.get_config("addr"),))
+            if answer.lower() == "y":
+                for chat in spac.get_chats():
+                    spac.delete_messages(chat.get_messages())
+        else:
+            print("deleting all messages in the %s account..." % (spac.get_config("addr"),))
+            with span("delete spider messages", spac.get_config("addr")):
+                for chat in spac.get_chats():
+                    messages = chat.get_messages()
+                    if messages:
+                        spac.delete_messages(messages)
+    with span("wait for shutdown"):
+        for spac in spiders:
+            spac.shutdown()
+        for ac in accounts:
+            ac.wait_shutdown()
+        for spac in spiders:
+            spac.wait_shutdown()
 
 
-def logintest(spider: dict, credentials: [dict], args, output) -> (deltachat.Account, [deltachat.Account]):
+def logintest(spiders: [dict], credentials: [dict], args, output) -> ([deltachat.Account], [deltachat.Account]):
     """Setup spider and test accounts.
 
-    :param spider: an entry dict
+    :param spiders: a list of entry dicts
     :param credentials: a list of entry dicts
     :param args: the command line arguments
     :param output: output object
     :return: the spider and test accounts
     """
-    spac = setup_account(output, spider, args.data_dir, SpiderPlugin,
-                         args.debug in spider["addr"], args.timeout, args.quiet)
-    accounts = []
-    for entry in credentials:
+    spacs = [setup_account(output, spider, args.data_dir, SpiderPlugin,
+                           args.debug in spider["addr"], args.timeout, args.quiet) for spider in spiders]
+
+    def setup_test_account(entry):
         debug = args.debug in entry["addr"]
-        acc = setup_account(output, entry, args.data_dir, TestPlugin, debug, args.timeout, args.quiet)
-        accounts.append(acc)
-    return spac, accounts
+        return setup_account(output, entry, args.data_dir, TestPlugin, debug, args.timeout, args.quiet)
+
+    # with --parallel, several accounts are set up at once; results keep the order of the accounts file
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        accounts = list(executor.map(setup_test_account, credentials))
+    output.sort_accounts([entry["addr"] for entry in credentials])
+    return spacs, accounts
+
+
+def for_each_account(function, accounts: [deltachat.Account], parallel: int):
+    """Run a test for each test account, several of them at the same time with --parallel.
+
+    :param function: the test, which takes a test account
+    :param accounts: test accounts
+    :param parallel: how many accounts are tested at the same time
+    """
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        # list() waits for all accounts and raises the exceptions of the test
+        list(executor.map(function, accounts))
 
 
 def setup_account(output, entry: dict, data_dir: str, plugin, debug: bool, timeout: int, quiet: bool) -> deltachat.Account:
@@ -303,8 +1152,10 @@ def setup_account(output, entry: dict, data_dir: str, plugin, debug: bool, timeo
 
     addr = entry["addr"]
     app_pw = entry["app_pw"]
+    number = output.count_setup()
 
     begin = time.time()
+    setup_begin = begin
 
     try:
         os.mkdir(os.path.join(data_dir, addr))
@@ -337,6 +1188,7 @@ def setup_account(output, entry: dict, data_dir: str, plugin, debug: bool, timeo
 
     if not ac.is_configured():
         begin = time.time()
+        plug.configure_events = []
         configtracker = ac.configure()
         try:
             configtracker.wait_finish(timeout=timeout)
@@ -346,10 +1198,14 @@ def setup_account(output, entry: dict, data_dir: str, plugin, debug: bool, timeo
             raise
 
         duration = time.time() - begin
+        stages = get_configure_stages(plug.configure_events, begin, time.time())
+        plug.configure_events = None
+        tracer.add_span("configure", addr, begin, time.time())
         print("%s: %s: successful configuration setup as %s in %.1f seconds." %
-              (len(output.accounts)+1, addr, plug.classtype, duration))
+              (number, addr, plug.classtype, duration))
         if plugin == TestPlugin:
             output.submit_setup_result(addr, duration)
+            output.submit_configure_stages(addr, stages)
 
     # account is configured, let's measure login time
     ac.stop_io()
@@ -358,10 +1214,13 @@ def setup_account(output, entry: dict, data_dir: str, plugin, debug: bool, timeo
     ac.start_io()
     plug.imap_connected.wait(timeout=timeout)
     duration = time.time() - begin
+    tracer.add_span("login", addr, begin, time.time())
+    tracer.add_span("setup_account", addr, setup_begin, time.time(), {"role": plug.classtype})
     if plugin == TestPlugin:
         output.submit_login_result(addr, duration)
+        output.submit_dns_result(addr, measure_lookup(ac.get_config("configured_mail_server")))
         print("%s: successful login as %s in %.1f seconds." %
-              (len(output.accounts), addr, duration))
+              (number, addr, duration))
 
     ac.output = output
     return ac
@@ -383,6 +1242,7 @@ def send_test_file(spac: deltachat.Account, account: deltachat.Account, testfile
     shutil.copy(testfile, newfilepath)
     message = chat.prepare_message_file(newfilepath)
     chat.send_prepared(message)
+    tracer.add_span("send test file", account.get_config("addr"), float(begin), time.time())
     return message
 
 
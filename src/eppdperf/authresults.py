@@ -0,0 +1,66 @@
+import re
+from email.message import Message
+
+
+AUTH_METHODS = ("dkim", "spf", "dmarc", "arc")
+
+
+def strip_comments(value: str) -> str:
+    """Remove (comments) from a header value.
+
+    :param value: the header value
+    :return: the header value without comments
+    """
+    previous = None
+    while previous != value:
+        previous = value
+        value = re.sub(r"\([^()]*\)", "", value)
+    return value
+
+
+def parse_authentication_results(headers: Message) -> dict:
+    """Extract the verdicts of the receiving server out of the Authentication-Results header (RFC 8601).
+
+    Only the topmost header is considered, because that one was added by the receiving server; headers further down
+    may come from the sending provider and are not trustworthy.
+
+    :param headers: the MIME headers of a received message
+    :return: a dictionary with the results of dkim, spf, dmarc, and arc, e.g. "pass" or "fail", or "none" if the
+        server did not check it; "domain" is the DKIM signing domain
+    """
+    verdict = {method: "none" for method in AUTH_METHODS}
+    verdict["domain"] = ""
+    authres = headers.get("Authentication-Results")
+    if authres is not None:
+        clauses = strip_comments(str(authres)).replace("\n", " ").split(";")
+        for clause in clauses[1:]:
+            match = re.match(r"\s*([\w-]+)\s*=\s*([\w-]+)", clause)
+            if match is None:
+                continue
+            method = match.group(1).lower()
+            if method not in AUTH_METHODS or verdict[method] != "none":
+                continue
+            verdict[method] = match.group(2).lower()
+            if method == "dkim":
+                domain = re.search(r"header\.[di]\s*=\s*@?([^\s;]+)", clause)
+                if domain is not None:
+                    verdict["domain"] = domain.group(1).lower()
+    if not verdict["domain"]:
+        signature = headers.get("DKIM-Signature")
+        if signature is not None:
+            domain = re.search(r"\bd\s*=\s*([^\s;]+)", str(signature))
+            if domain is not None:
+                verdict["domain"] = domain.group(1).lower()
+    return verdict
+
+
+def format_verdict(verdict: dict) -> str:
+    """Format an authentication verdict for the CSV output.
+
+    :param verdict: a dictionary as returned by parse_authentication_results
+    :return: a compact string like "dkim=pass spf=pass dmarc=pass arc=none d=example.org"
+    """
+    results = ["%s=%s" % (method, verdict[method]) for method in AUTH_METHODS]
+    if verdict["domain"]:
+        results.append("d=" + verdict["domain"])
+    return " ".join(results)
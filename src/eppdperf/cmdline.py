@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+import sys
+import time
 import argparse
 import tempfile
 from typing import Tuple
@@ -8,11 +10,15 @@ from datetime import datetime
 from random import getrandbits
 
 from .output import Output
-from .analysis import (
-    interoptest, grouptest, filetest, recipientstest,
-    featurestest, logintest,
-    shutdown_accounts, get_file_size
-)
+from .hops import hopsreport
+from .compare import comparereport
+from .tracing import span, tracer
+from .progress import reporter
+from .profiling import start_profiler
+from .dnscache import DNSCache
+from .deadlines import Deadlines, load_history
+from .preflight import LimitsCache
+from .storage import create_ram_dir, measure_storage_latency, StorageMonitor
 
 
 def parse_config_line(line: str):
@@ -38,40 +44,49 @@ def parse_accounts_file(accounts_file: str) -> Tuple[list, dict]:
     """import and parse accounts-file
 
     :param accounts_file: (str) path to accounts file
-    :return: a list with test account entry dicts, a dict with the spider entry dict
+    :return: a list with test account entry dicts, a list with the spider entry dicts
     """
     with open(accounts_file, "r", encoding="UTF-8") as f:
         lines = f.readlines()
     credentials = []
-    spider = None
+    spiders = []
     for line in lines:
         entry = parse_config_line(line)
         if entry is not None:
             if entry.get("spider") == "true":
-                spider = entry
+                spiders.append(entry)
             else:
                 credentials.append(entry)
-    return credentials, spider
+    return credentials, spiders
 
 
-def generate_file_from_string(filesize: str) -> tempfile.NamedTemporaryFile:
-    """Create a file from a string like "20M" or "400K".
+def parse_filesize(filesize: str) -> int:
+    """Parse a string like "20M" or "400K".
 
-    :param filesize: command line argument -f
-    :return: a temporary file for testing
+    :param filesize: a size, optionally with a K, M, or G suffix
+    :return: the size in bytes
     """
-    assert filesize[0].isdigit(), "Please specify --filesize in a format like '2M'"
-    assert filesize[0].isalnum(), "Please specify --filesize in a format like '2M'"
+    assert filesize[0].isdigit(), "Please specify sizes in a format like '2M'"
+    assert filesize[0].isalnum(), "Please specify sizes in a format like '2M'"
     kbytes = filesize.lower().partition("k")
     if kbytes[1] == "k":
-        return generate_file_from_int(int(kbytes[0]) * 1024)
+        return int(kbytes[0]) * 1024
     mbytes = filesize.lower().partition("m")
     if mbytes[1] == "m":
-        return generate_file_from_int(int(mbytes[0]) * 1024 * 1024)
+        return int(mbytes[0]) * 1024 * 1024
     mbytes = filesize.lower().partition("g")
     if mbytes[1] == "g":
-        return generate_file_from_int(int(mbytes[0]) * 1024 * 1024 * 1024)
-    return generate_file_from_int(int(filesize))
+        return int(mbytes[0]) * 1024 * 1024 * 1024
+    return int(filesize)
+
+
+def generate_file_from_string(filesize: str) -> tempfile.NamedTemporaryFile:
+    """Create a file from a string like "20M" or "400K".
+
+    :param filesize: command line argument -f
+    :return: a temporary file for testing
+    """
+    return generate_file_from_int(parse_filesize(filesize))
 
 
 def generate_file_from_int(filesizeint: int) -> tempfile.NamedTemporaryFile:
@@ -89,7 +104,12 @@ def generate_file_from_int(filesizeint: int) -> tempfile.NamedTemporaryFile:
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("command", help="Which test to perform",
-                        choices=["login", "group", "interop", "file", "recipients", "features", "dkimchecks"])
+                        choices=["login", "group", "interop", "file", "recipients", "features", "dkimchecks", "idle",
+                                 "throughput", "reconnect", "sync", "hops", "compare"])
+    parser.add_argument("files", nargs="*",
+                        help="result CSV files to analyse, for the hops and compare commands; for the file, group, "
+                             "interop, and dkimchecks tests, earlier results from which per-provider deadlines are "
+                             "taken")
     parser.add_argument("-y", "--yes", action="store_true", default=False,
                         help="always answer yes if prompted")
     parser.add_argument("-a", "--accounts_file", help="a file containing mail accounts",
@@ -99,33 +119,132 @@ def main():
     parser.add_argument("-o", "--output", type=str, default=None,
                         help="output file for the results in CSV format")
     parser.add_argument("-t", "--timeout", type=int, default=90,
-                        help="seconds after which tests are aborted")
+                        help="seconds after which tests are aborted; with earlier results as files, only for providers "
+                             "which are not in them")
     parser.add_argument("-f", "--filesize", type=str, default="2M",
                         help="size of the test file, randomly generated")
     parser.add_argument("-v", "--debug", type=str, default="dz0n3zu98q3ud982qufm982uf98u2f0982f",
                         help="show deltachat logs for specific account")
     parser.add_argument("-s", "--select", type=str, default="",
-                        help="run the test only for the first address matching the select arg")
+                        help="run the test only for the addresses matching the select arg, e.g. a domain")
+    parser.add_argument("-p", "--parallel", type=int, default=1,
+                        help="how many accounts are set up at the same time, and tested at the same time in the "
+                             "features, reconnect, and sync tests")
     parser.add_argument("-m", "--max_recipients", type=str, default="100,100,5",
                         help="send to specified number of recipients. if comma-sepaerated, it specifies a start number and the second value is a step wise increase")
+    parser.add_argument("--probe", action="store_true", default=False,
+                        help="recipients test: pipeline RCPT TO commands for the maximum number of recipients and "
+                             "abort with RSET, instead of sending messages")
+    parser.add_argument("-r", "--repetitions", type=int, default=5,
+                        help="how often repeated measurements like the idle test are performed")
+    parser.add_argument("--group_sizes", type=str, default=None,
+                        help="comma-separated group sizes, e.g. 2,5,10,20,50, to run the group test for each of them")
+    parser.add_argument("--rates", type=str, default="6,12,30,60",
+                        help="comma-separated messages per minute for each minute of the throughput test ramp")
+    parser.add_argument("--preflight", choices=["off", "mark", "skip"], default="off",
+                        help="file test: check SMTP SIZE limits and quotas first, and skip or only mark the accounts "
+                             "whose file can not arrive")
+    parser.add_argument("--limits_cache", type=str, default=None,
+                        help="JSON file which caches the SMTP SIZE limits for a day, e.g. across a sweep of file "
+                             "sizes")
+    parser.add_argument("--sync_messages", type=int, default=200,
+                        help="how many messages the sync test appends to its test folder")
+    parser.add_argument("--sync_changes", type=int, default=10,
+                        help="how many messages the sync test flags as seen before the resync")
+    parser.add_argument("--raw_headers", type=str, default=None,
+                        help="file to which the dkimchecks test writes the raw MIME headers of received messages")
+    parser.add_argument("--storage", choices=["disk", "ram"], default="disk",
+                        help="keep the account databases and blobdirs on disk or in memory")
+    parser.add_argument("--ram_limit", type=str, default="1G",
+                        help="how much memory the account data may take up with --storage ram; the run is aborted as "
+                             "soon as it grows beyond it")
+    parser.add_argument("--dns_cache", type=str, default=None,
+                        help="JSON file which caches DNS answers for an hour across runs; only for the connections "
+                             "eppdperf opens itself, not for deltachat's, see README")
+    parser.add_argument("--status", type=str, default=None,
+                        help="write the progress of the file, group, interop, and dkimchecks tests to this JSON file")
+    parser.add_argument("--trace", type=str, default=None,
+                        help="write a Chrome trace of the run phases to this JSON file")
+    parser.add_argument("--profile", type=str, default=None,
+                        help="sample all threads during the run and write the collapsed stacks to this file")
+    parser.add_argument("--windows", type=str, default=None,
+                        help="compare the runs of two time windows, e.g. 2022-01-10:2022-01-12,2022-01-13:2022-01-14")
     parser.add_argument("-q", "--quiet", action="store_true", help="suppress deltachat warnings etc.")
-    args = parser.parse_args()
+    args = parser.parse_intermixed_args()
+    tracer.enabled = args.trace is not None
+    reporter.status_file = args.status
+    if args.profile is None:
+        run(args)
+        return
+    profiler = start_profiler()
+    try:
+        run(args)
+    finally:
+        # also write the profile if the run was aborted, e.g. with Ctrl+C
+        profiler.stop()
+        profiler.write(args.profile)
+
+
+def run(args):
+    """Run the command which was given on the command line.
+
+    :param args: the command line arguments
+    """
+    if args.command == "hops":
+        assert args.files, "hops command needs results/file-*.csv files to analyse"
+        lines = hopsreport(args.files)
+        print("\n".join(lines))
+        if args.output is not None:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines))
+        return
+
+    if args.command == "compare":
+        lines, regressed = comparereport(args.files, args.windows)
+        print("\n".join(lines))
+        if args.output is not None:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines))
+        if regressed:
+            print("Regressions found.")
+            sys.exit(1)
+        return
 
-    credentials, spider = parse_accounts_file(args.accounts_file)
+    # analysis imports deltachat and its FFI bindings; only load them when accounts are created
+    from .analysis import (
+        interoptest, grouptest, groupscalingtest, filetest, recipientstest, idletest, throughputtest,
+        featurestest, logintest, reconnecttest, synctest,
+        shutdown_accounts, get_file_size
+    )
+
+    credentials, spiders = parse_accounts_file(args.accounts_file)
     if args.command != "interop" and args.command != "dkimchecks":
         if args.select == "":
             args.select = "dz0n3zu98q3ud982qufm982uf98u2f0982f"
-        for entry in credentials:
-            if args.select in entry["addr"]:
-                credentials = [entry]
-                break
+        selected = [entry for entry in credentials if args.select in entry["addr"]]
+        if selected:
+            credentials = selected
 
     if args.output is None:
         args.output = "results/%s-%s.csv" % (args.command, datetime.now().strftime("%Y-%m-%d"))
     output = Output(args, len(credentials))
 
+    if args.command == "throughput":
+        rates = [int(x) for x in args.rates.strip().split(",")]
+        assert all(rate > 0 for rate in rates), "--rates must be messages per minute greater than 0"
+
     # ensuring account data directory
-    if args.data_dir is None:
+    if args.storage == "ram":
+        assert args.data_dir is None, "--data_dir can not be used with --storage ram"
+        ram_limit = parse_filesize(args.ram_limit)
+        tempdir = create_ram_dir(ram_limit)
+        args.data_dir = tempdir.name
+        # the temporary directory may be a tmpfs itself, the home directory is on disk
+        output.store_storage_latency("disk", *measure_storage_latency(os.path.expanduser("~")))
+        output.store_storage_latency("ram", *measure_storage_latency(args.data_dir))
+        storage_monitor = StorageMonitor(args.data_dir, ram_limit)
+        storage_monitor.start()
+    elif args.data_dir is None:
         tempdir = tempfile.TemporaryDirectory(prefix="perfanal")
         args.data_dir = tempdir.name
     elif not os.path.exists(args.data_dir):
@@ -133,31 +252,74 @@ def main():
 
     print("Storing account data in %s" % (args.data_dir,))
 
-    spac, accounts = logintest(spider, credentials, args, output)
+    if args.dns_cache is not None:
+        dns_cache = DNSCache(args.dns_cache)
+        dns_cache.install()
+
+    with span("logintest"):
+        spacs, accounts = logintest(spiders, credentials, args, output)
+    # the group and idle tests only use the first spider
+    spac = spacs[0] if spacs else None
 
+    filesize = None
+    if args.command == "file":
+        testfile = generate_file_from_string(args.filesize)
+        filesize = get_file_size(testfile.name)
+    deadlines = Deadlines(load_history(args.files, args.command, filesize), args.timeout)
+    test_begin = time.time()
     if args.command == "group":
-        assert spider is not None, "group test needs a spider echobot account to run"
-        grouptest(spac, output, accounts, args.timeout)
+        assert spiders, "group test needs a spider echobot account to run"
+        if args.group_sizes is None:
+            grouptest(spac, output, accounts, args.timeout, deadlines)
+        else:
+            sizes = [int(x) for x in args.group_sizes.strip().split(",")]
+            groupscalingtest(spac, output, accounts, args.timeout, sizes, deadlines)
 
     elif args.command == "interop":
-        interoptest(output, accounts, args.timeout, args.select)
+        interoptest(output, accounts, args.timeout, args.select, deadlines=deadlines)
 
     elif args.command == "dkimchecks":
         for ac in accounts:
             ac.set_config("save_mime_headers", 1)
-        interoptest(output, accounts, args.timeout, args.select, dkim_check=True)
+        interoptest(output, accounts, args.timeout, args.select, dkim_check=True, deadlines=deadlines)
 
     elif args.command == "file":
-        assert spider is not None, "file test needs a spider echobot account to run"
-        testfile = generate_file_from_string(args.filesize)
-        output.store_file_size(get_file_size(testfile.name))
-        filetest(spac, output, accounts, args.timeout, testfile.name)
+        assert spiders, "file test needs a spider echobot account to run"
+        # the spiders need the Message-ID to download the test files again
+        for spider in spacs:
+            spider.set_config("save_mime_headers", 1)
+        output.store_file_size(filesize)
+        limits = None if args.preflight == "off" else LimitsCache(args.limits_cache)
+        filetest(spac, output, accounts, args.timeout, testfile.name, deadlines, spiders=spacs, limits=limits,
+                 skip=args.preflight == "skip")
 
     elif args.command == "features":
-        featurestest(output, accounts)
+        featurestest(output, accounts, args.parallel)
+
+    elif args.command == "reconnect":
+        reconnecttest(output, accounts, args.repetitions, args.parallel)
+
+    elif args.command == "sync":
+        synctest(output, accounts, args.sync_messages, args.sync_changes, args.parallel)
+
+    elif args.command == "idle":
+        assert spiders, "idle test needs a spider account to send the messages"
+        idletest(spac, output, accounts, args.timeout, args.repetitions)
+
+    elif args.command == "throughput":
+        assert spiders, "throughput test needs a spider account to receive the messages"
+        # the throughput test messages are sent as classic e-mails; the spiders only show them during the test
+        show_emails = [spider.get_config("show_emails") for spider in spacs]
+        for spider in spacs:
+            spider.set_config("show_emails", "2")
+        try:
+            throughputtest(spac, output, accounts, args.timeout, rates, spiders=spacs)
+        finally:
+            for spider, value in zip(spacs, show_emails):
+                spider.set_config("show_emails", value)
 
     elif args.command == "recipients":
-        assert spider is not None, "recipients test needs a spider echobot account to run"
+        assert spiders, "recipients test needs a spider echobot account to run"
         rec = [int(x) for x in args.max_recipients.strip().split(",")]
         if len(rec) == 1:
             recnums = [rec[0]]
@@ -166,12 +328,21 @@ def main():
         else:
             raise ValueError("option does not use more than two args")
         try:
-            recipientstest(spac, output, accounts, args.timeout, recnums)
+            recipientstest(spac, output, accounts, args.timeout, recnums, probe=args.probe, spiders=spacs)
         except KeyboardInterrupt:
             print("Test interrupted.")
+    tracer.add_span("%s test" % (args.command,), "main", test_begin, time.time())
+    if args.storage == "ram":
+        output.store_storage_peak(storage_monitor.stop())
 
-    shutdown_accounts(args, accounts, spac)
-    output.write()
+    with span("shutdown_accounts"):
+        shutdown_accounts(args, accounts, spacs)
+    with span("Output.write"):
+        output.write()
+    if args.dns_cache is not None:
+        dns_cache.save()
+    if args.trace is not None:
+        tracer.write(args.trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+import re
+import datetime
+
+from .stats import median, mann_whitney_greater, sign_test_greater
+
+
+# cells which are neither a measurement nor a failure
+SKIPPED_CELLS = ("", "self", "already configured")
+
+# below this many durations per side, the Mann-Whitney U test can not become significant, and the medians of the
+# providers are compared with a paired sign test instead
+MIN_SAMPLES = 3
+
+
+def read_results(path: str) -> ([str], {str: [str]}):
+    """Read a result CSV file as written by Output.write.
+
+    :param path: path to a results/*.csv file
+    :return: the provider of each column, and a dictionary with the row titles as keys and the cells as values
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [[cell.strip() for cell in line.rstrip("\n").split(",")] for line in f if line.strip()]
+    providers = []
+    for provider in rows[0][1:]:
+        # several accounts of the same provider get their own columns
+        count = len([p for p in providers if p.partition("#")[0] == provider])
+        providers.append(provider if count == 0 else "%s#%s" % (provider, count + 1))
+    return providers, {row[0]: row[1:] for row in rows[1:]}
+
+
+def is_latency_row(title: str) -> bool:
+    """Whether a row of a result file contains durations in seconds.
+
+    :param title: the first cell of the row
+    :return: True if the cells are durations, or errors where the measurement failed
+    """
+    return "(in seconds)" in title or title.startswith("Received by ")
+
+
+def get_metric(title: str) -> str:
+    """Return which metric a latency row measures. The rows of the receivers in the interop and group tests all
+    measure the delivery time, so their durations are compared together.
+
+    :param title: the first cell of the row
+    :return: the name of the metric
+    """
+    if title.lower().startswith("received by "):
+        return "delivery (in seconds)"
+    return title.rstrip(":")
+
+
+def get_run_date(path: str) -> datetime.date:
+    """Return the date of a run from its result file name, e.g. results/file-2022-01-13-10MB.csv.
+
+    :param path: path to a results/*.csv file
+    :return: the date of the run
+    """
+    match = re.search(r"\d{4}-\d{2}-\d{2}", path)
+    if match is None:
+        raise ValueError("%s does not contain a date" % (path,))
+    return datetime.datetime.strptime(match.group(0), "%Y-%m-%d").date()
+
+
+def collect_results(paths: [str]) -> {(str, str): {str: ([float], int)}}:
+    """Collect the durations and failures of several runs for each provider, metric, and pair.
+
+    :param paths: paths to result files of the same test
+    :return: a dictionary with (provider, metric) tuples as keys; the values are dictionaries with the row titles
+        as keys and a tuple of the durations and the number of failures as values
+    """
+    results = {}
+    for path in paths:
+        providers, rows = read_results(path)
+        for title, cells in rows.items():
+            if not is_latency_row(title):
+                continue
+            for provider, cell in zip(providers, cells):
+                if cell in SKIPPED_CELLS:
+                    continue
+                pairs = results.setdefault((provider, get_metric(title)), {})
+                durations, failures = pairs.get(title, ([], 0))
+                try:
+                    durations.append(float(cell))
+                except ValueError:
+                    failures += 1
+                pairs[title] = (durations, failures)
+    return results
+
+
+def compare_results(baseline: dict, new: dict, alpha: float = 0.05, min_ratio: float = 1.2) -> ([str], bool):
+    """Find latency regressions and newly failing providers and pairs.
+
+    A provider regressed in a metric if its durations across all pairs are significantly greater than in the
+    baseline, and their median grew by at least min_ratio. With fewer than MIN_SAMPLES durations on a side, e.g. when
+    comparing two file test runs, the Mann-Whitney U test can not become significant; then a paired sign test over
+    the medians of all such providers decides whether the metric regressed, and those providers whose median grew by
+    at least min_ratio are flagged. A provider or pair is newly failing if it only had failures in the new runs, but
+    succeeded in the baseline.
+
+    :param baseline: the baseline results, as returned by collect_results
+    :param new: the new results, as returned by collect_results
+    :param alpha: the significance level of the Mann-Whitney U test and the sign test
+    :param min_ratio: how much the median needs to grow to count as a regression
+    :return: the report lines in CSV format, and whether something regressed
+    """
+    lines = ["provider, metric, baseline median, new median, p-value, verdict"]
+    regressed = False
+    medians = {}
+    for key in sorted(set(baseline) & set(new)):
+        pairs = sorted(set(baseline[key]) & set(new[key]))
+        basedurations = [d for pair in pairs for d in baseline[key][pair][0]]
+        newdurations = [d for pair in pairs for d in new[key][pair][0]]
+        if basedurations and newdurations and min(len(basedurations), len(newdurations)) < MIN_SAMPLES:
+            medians.setdefault(key[1], []).append((median(basedurations), median(newdurations)))
+    paired = {metric: sign_test_greater(*zip(*values)) for metric, values in medians.items()}
+
+    for key in sorted(set(baseline) & set(new)):
+        provider, metric = key
+        pairs = sorted(set(baseline[key]) & set(new[key]))
+        basedurations = [d for pair in pairs for d in baseline[key][pair][0]]
+        newdurations = [d for pair in pairs for d in new[key][pair][0]]
+        if basedurations and not newdurations:
+            lines.append("%s, %s, %.2f, , , newly failing" % (provider, metric, median(basedurations)))
+            regressed = True
+            continue
+        if not basedurations:
+            continue
+        basemedian = median(basedurations)
+        newmedian = median(newdurations)
+        if min(len(basedurations), len(newdurations)) < MIN_SAMPLES:
+            p = paired[metric]
+            verdict = "insufficient samples"
+            if p < alpha:
+                verdict = "ok"
+                if newmedian > basemedian * min_ratio:
+                    verdict = "regression"
+                    regressed = True
+        else:
+            p = mann_whitney_greater(basedurations, newdurations)
+            verdict = "ok"
+            if p < alpha and newmedian > basemedian * min_ratio:
+                verdict = "regression"
+                regressed = True
+        lines.append("%s, %s, %.2f, %.2f, %.4f, %s" % (provider, metric, basemedian, newmedian, p, verdict))
+        for pair in pairs:
+            if baseline[key][pair][0] and not new[key][pair][0]:
+                lines.append("%s, %s, , , , newly failing" % (provider, pair.rstrip(":")))
+                regressed = True
+    for metric in sorted(paired):
+        if paired[metric] < alpha:
+            verdict = "regression"
+        elif 0.5 ** len(medians[metric]) >= alpha:
+            verdict = "insufficient samples"
+        else:
+            verdict = "ok"
+        lines.append("all providers (sign test), %s, , , %.4f, %s" % (metric, paired[metric], verdict))
+    return lines, regressed
+
+
+def parse_window(window: str) -> (datetime.date, datetime.date):
+    """Parse a time window like "2022-01-10:2022-01-12".
+
+    :param window: first and last day of the window, separated by a colon
+    :return: the first and last day
+    """
+    first, _, last = window.partition(":")
+    first = datetime.datetime.strptime(first, "%Y-%m-%d").date()
+    last = datetime.datetime.strptime(last or first.isoformat(), "%Y-%m-%d").date()
+    return first, last
+
+
+def comparereport(paths: [str], windows: str = None) -> ([str], bool):
+    """Compare a baseline run with a new run, or the runs of two time windows.
+
+    :param paths: result files; without windows, exactly the baseline and the new result file
+    :param windows: optional "FIRST:LAST,FIRST:LAST" days of the baseline and the new window
+    :return: the report lines in CSV format, and whether something regressed
+    """
+    if windows is None:
+        assert len(paths) == 2, "compare needs a baseline and a new result file, or --windows"
+        return compare_results(collect_results(paths[:1]), collect_results(paths[1:]))
+    basewindow, _, newwindow = windows.partition(",")
+    basefirst, baselast = parse_window(basewindow)
+    newfirst, newlast = parse_window(newwindow)
+    basepaths = [p for p in paths if basefirst <= get_run_date(p) <= baselast]
+    newpaths = [p for p in paths if newfirst <= get_run_date(p) <= newlast]
+    assert basepaths and newpaths, "no result files in one of the windows %s" % (windows,)
+    return compare_results(collect_results(basepaths), collect_results(newpaths))
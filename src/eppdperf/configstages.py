@@ -0,0 +1,70 @@
+import re
+
+
+CONFIGURE_STAGES = ("autoconfig", "dns", "imap probe", "smtp probe", "other")
+
+# the log messages with which deltachat's configure.rs and read_url.rs begin a stage, checked in this order; the
+# provider database lookup resolves the MX records of the domain, which is why it counts as DNS
+STAGE_PATTERNS = (
+    ("dns", re.compile(r"^checking internal provider-info for offline autoconfig")),
+    ("autoconfig", re.compile(r"^(no )?offline autoconfig found|^requesting url ")),
+    ("imap probe", re.compile(r"^(trying|success): imap: ")),
+    ("smtp probe", re.compile(r"^(trying|success): smtp: ")),
+)
+
+# stages which recent cores run in parallel
+PROBE_STAGES = ("imap probe", "smtp probe")
+
+
+def get_stage(message: str) -> str:
+    """Return which configure stage a deltachat log message begins.
+
+    :param message: the comment of a DC_EVENT_INFO or DC_EVENT_CONFIGURE_PROGRESS event
+    :return: one of CONFIGURE_STAGES, or None if the message does not begin a stage
+    """
+    message = message.strip().lower()
+    for stage, pattern in STAGE_PATTERNS:
+        if pattern.match(message):
+            return stage
+    return None
+
+
+def get_configure_stages(events: [(float, str)], begin: float, end: float) -> {str: float}:
+    """Split the configure duration into stages, based on the log messages deltachat emits meanwhile.
+
+    The time between two events is attributed to the stage of the earlier event; events which do not tell their
+    stage continue the previous one. The IMAP and SMTP probes are measured separately, each from its first attempt
+    until it succeeds, or until the next stage begins if it fails. Older cores probe IMAP and SMTP one after the
+    other; recent cores probe them in parallel, then the two probe stages overlap and all stages together add up to
+    more than the configure duration.
+
+    :param events: (timestamp, message) tuples in the order they were emitted
+    :param begin: timestamp when the configuration began
+    :param end: timestamp when the configuration finished
+    :return: the seconds spent in each of the CONFIGURE_STAGES
+    """
+    stages = {stage: 0.0 for stage in CONFIGURE_STAGES}
+    # begin and end of each probe; the end is None while the probe runs
+    probes = {}
+    current = "other"
+    previous = begin
+    for timestamp, message in events:
+        if None not in [stop for _, stop in probes.values()]:
+            stages[current] += timestamp - previous
+        stage = get_stage(message)
+        if stage in PROBE_STAGES:
+            probe = probes.setdefault(stage, [timestamp, None])
+            probe[1] = timestamp if message.strip().lower().startswith("success") else None
+            # after the probes, the time counts as "other" until the next stage begins
+            current = "other"
+        elif stage is not None:
+            for probe in probes.values():
+                if probe[1] is None:
+                    probe[1] = timestamp
+            current = stage
+        previous = timestamp
+    if None not in [stop for _, stop in probes.values()]:
+        stages[current] += max(0.0, end - previous)
+    for stage, (start, stop) in probes.items():
+        stages[stage] += max(0.0, (end if stop is None else stop) - start)
+    return stages
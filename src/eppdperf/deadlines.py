@@ -0,0 +1,141 @@
+import os
+import re
+import time
+
+from .stats import percentile
+from .compare import read_results, get_metric
+
+
+# deadlines are this factor above the historical percentile, but not shorter than MIN_DEADLINE seconds and not
+# longer than MAX_TIMEOUT_FACTOR times the timeout
+DEADLINE_FACTOR = 1.5
+MIN_DEADLINE = 10
+MAX_TIMEOUT_FACTOR = 4
+
+# result file names as written by Output, e.g. file-2022-01-13-10MB.csv or group-2022-01-10-2.csv
+RESULT_FILE = re.compile(r"^(?P<command>[a-z]+)-\d{4}-\d{2}-\d{2}(-(?P<suffix>[^.]+))?\.csv$")
+
+
+def get_domain(title: str) -> str:
+    """Return the receiving provider of a "received by" row of a result file.
+
+    :param title: the first cell of the row, e.g. "Received by alice@example.org:" or
+        "received by example.org (in seconds):"
+    :return: the domain, e.g. "example.org", or None if the row is not about a receiver
+    """
+    if not title.lower().startswith("received by "):
+        return None
+    receiver = title[len("received by "):].split(" ")[0].rstrip(":")
+    return receiver.split("@")[-1]
+
+
+def is_same_test(path: str, command: str, filesize: str = None) -> bool:
+    """Whether a result file comes from the same kind of test, so its durations can predict the current one.
+
+    :param path: path to a results/*.csv file
+    :param command: the current test, e.g. "group"
+    :param filesize: for the file test, the size of the test file, e.g. "10MB"
+    :return: True if the file is from the same test, and for the file test, with the same file size
+    """
+    match = RESULT_FILE.match(os.path.basename(path))
+    if match is None or match.group("command") != command:
+        return False
+    suffix = (match.group("suffix") or "").split("-")
+    # the per-provider and storage files do not have one column per account
+    if suffix[-1] in ("providers", "storage"):
+        return False
+    return filesize is None or suffix[0] == filesize
+
+
+def load_history(paths: [str], command: str, filesize: str = None) -> {str: [float]}:
+    """Collect the delivery durations of earlier runs of the same file, group, interop, or dkimchecks test for each
+    provider. Other tests, and file tests with another file size, take different times, so their result files are
+    left out.
+
+    A message counts for the provider which sent it and for the one which received it, if it is known.
+
+    :param paths: paths to results/*.csv files
+    :param command: the current test, e.g. "group"
+    :param filesize: for the file test, the size of the test file, e.g. "10MB"
+    :return: a dictionary with the domains as keys and the durations as values
+    """
+    history = {}
+    for path in paths:
+        if not is_same_test(path, command, filesize):
+            print("[WARNING] %s is not a result of this %s test, not using it for the deadlines" % (path, command))
+            continue
+        providers, rows = read_results(path)
+        for title, cells in rows.items():
+            if get_metric(title) != "delivery (in seconds)" and not title.startswith("sent "):
+                continue
+            receiver = get_domain(title)
+            for provider, cell in zip(providers, cells):
+                try:
+                    duration = float(cell)
+                except ValueError:
+                    continue
+                history.setdefault(provider.partition("#")[0], []).append(duration)
+                if receiver is not None and receiver != provider.partition("#")[0]:
+                    history.setdefault(receiver, []).append(duration)
+    return history
+
+
+class Deadlines:
+    """Per-provider deadlines for the messages of a test, so the main thread stops waiting as soon as every
+    outstanding message is overdue, instead of always waiting for the whole timeout.
+
+    The deadline of a provider is a high percentile of its historical delivery durations times DEADLINE_FACTOR;
+    slow but healthy providers thereby get more time than the timeout, up to MAX_TIMEOUT_FACTOR times as much, and
+    broken ones are given up on early. Providers without history get the timeout.
+
+    :param history: the historical durations by domain, as returned by load_history
+    :param timeout: seconds to wait for providers without history
+    :param p: which percentile of the historical durations is used
+    """
+
+    def __init__(self, history: {str: [float]}, timeout: float, p: int = 95):
+        self.timeout = timeout
+        self.deadlines = {}
+        for domain, durations in history.items():
+            if durations:
+                deadline = max(MIN_DEADLINE, DEADLINE_FACTOR * percentile(durations, p))
+                self.deadlines[domain] = min(deadline, MAX_TIMEOUT_FACTOR * timeout)
+
+    def get(self, addr: str) -> float:
+        """Return the deadline of the provider of a test account.
+
+        :param addr: the email address of the test account
+        :return: seconds to wait for its messages
+        """
+        return self.deadlines.get(addr.split("@")[-1], self.timeout)
+
+    def get_item(self, receiver: str, sender: str) -> float:
+        """Return the deadline of a message, which is the one of its slower provider.
+
+        :param receiver: the email address which receives the message, or None if it is the spider
+        :param sender: the email address which sends the message, or None if it is the spider
+        :return: seconds to wait for the message
+        """
+        return max(self.get(addr) for addr in (receiver, sender) if addr is not None)
+
+    def get_longest(self, addrs: [str]) -> float:
+        """Return how long the test waits at most.
+
+        :param addrs: the email addresses of the test accounts
+        :return: the longest deadline of their providers
+        """
+        return max([self.get(addr) for addr in addrs] or [self.timeout])
+
+    def is_over(self, outstanding: [(str, str)], begin: float) -> bool:
+        """Whether all outstanding messages are overdue.
+
+        :param outstanding: (receiver, sender) tuples of the messages which did not arrive yet,
+            see Output.get_outstanding
+        :param begin: timestamp when the wait for the messages began
+        :return: True if the wait can be stopped
+        """
+        elapsed = time.time() - begin
+        for receiver, sender in outstanding:
+            if elapsed < self.get_item(receiver, sender):
+                return False
+        return True
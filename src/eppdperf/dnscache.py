@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import socket
+import threading
+
+
+# the resolver of the system, also after a DNSCache was installed
+resolve = socket.getaddrinfo
+
+# seconds after which a cached answer is looked up again, so moved servers are noticed between runs
+DNS_CACHE_MAX_AGE = 60 * 60
+
+
+class DNSCache:
+    """Cache the DNS answers of the connections this process opens itself. The answers are kept in a JSON file, so
+    repeated runs measure the provider instead of the resolver.
+
+    Only the IMAP and SMTP connections which eppdperf opens itself use the cache: those of the download, idle,
+    throughput, recipients, reconnect, and sync tests, and of the preflight checks of the file test. Deltachat
+    resolves the names of its own connections in its core, so the cache does not apply to the login, file, group,
+    interop, and dkimchecks tests.
+
+    :param path: the JSON file with the cached answers; it is created if it does not exist
+    :param max_age: seconds after which a cached answer is looked up again
+    """
+
+    def __init__(self, path: str, max_age: float = DNS_CACHE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.answers = {}
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.answers = json.load(f)
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        """Drop-in replacement for socket.getaddrinfo which answers from the cache, unless the answer expired.
+        """
+        key = json.dumps([host, port, list(args), sorted(kwargs.items())], default=int)
+        with self.lock:
+            entry = self.answers.get(key)
+        if entry is None or time.time() - entry["checked"] > self.max_age:
+            result = resolve(host, port, *args, **kwargs)
+            with self.lock:
+                self.answers[key] = {
+                    "answer": [[int(family), int(kind), proto, canonname, list(sockaddr)]
+                               for family, kind, proto, canonname, sockaddr in result],
+                    "checked": time.time(),
+                }
+            return result
+        return [(socket.AddressFamily(family), socket.SocketKind(kind), proto, canonname, tuple(sockaddr))
+                for family, kind, proto, canonname, sockaddr in entry["answer"]]
+
+    def install(self):
+        """Answer all socket.getaddrinfo calls of this process from the cache.
+        """
+        socket.getaddrinfo = self.getaddrinfo
+
+    def save(self):
+        """Write the cached answers to the JSON file.
+        """
+        with self.lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.answers, f)
+
+
+def measure_lookup(host: str) -> float:
+    """Measure how long the resolver takes to look up a host name, bypassing any DNS cache of this process.
+
+    :param host: the host name
+    :return: seconds the lookup took, or None if it failed
+    """
+    begin = time.time()
+    try:
+        resolve(host, None)
+    except socket.gaierror:
+        return None
+    return time.time() - begin
@@ -0,0 +1,146 @@
+import datetime
+from email.utils import parsedate_to_datetime
+
+from .stats import percentile
+
+
+def parse_hop(hop: str) -> dict:
+    """Parse a hop string of the message info into a structured record.
+
+    Hops come in several formats: the ISO timestamps which the spider adds for sending and receiving, the
+    "Sent: 2022.01.11 19:56:14 UTC" and "Received: 2022.01.11 20:06:07 UTC" lines of older runs, and
+    "From: a; By: b; Date: Tue, 11 Jan 2022 20:56:33 +0100" as deltachat emits them, where From and Date may be
+    missing. In result files, the semicolons and commas are removed.
+
+    :param hop: a hop string, as collected by plugins.SpiderPlugin or read from a result file
+    :return: a dictionary with "from" and "by" host names and a "timestamp" in seconds since the epoch;
+        each of them may be None
+    """
+    hop = hop.strip()
+    record = {"from": None, "by": None, "timestamp": None}
+    try:
+        record["timestamp"] = datetime.datetime.fromisoformat(hop).timestamp()
+        return record
+    except ValueError:
+        pass
+    if hop.startswith("Sent: ") or hop.startswith("Received: "):
+        datestr = hop.partition(" ")[2].partition(" by ")[0].replace(" UTC", "")
+        try:
+            date = datetime.datetime.strptime(datestr.strip(), "%Y.%m.%d %H:%M:%S")
+            record["timestamp"] = date.replace(tzinfo=datetime.timezone.utc).timestamp()
+        except ValueError:
+            pass
+        return record
+    rest, _, datestr = hop.partition("Date: ")
+    rest, _, by = rest.partition("By: ")
+    record["by"] = by.strip(" ;") or None
+    if rest.startswith("From: "):
+        record["from"] = rest.partition(" ")[2].strip(" ;") or None
+    if datestr.strip():
+        try:
+            record["timestamp"] = parsedate_to_datetime(datestr.strip()).timestamp()
+        except (TypeError, ValueError):
+            pass  # parsedate_to_datetime raises TypeError for unparsable dates before Python 3.10
+    return record
+
+
+def parse_hops(hops: [str]) -> [dict]:
+    """Parse the hops of one file test message and compute how long each hop took.
+
+    The first hop is when the sender sent the message, the last one when the spider received it. The delay of a hop
+    is measured from the previous hop with a timestamp; hops without a date have no delay.
+
+    :param hops: the hop strings, in the order the message passed them
+    :return: a list of hop records, with an additional "host" and "delay" in seconds
+    """
+    records = [parse_hop(hop) for hop in hops]
+    previous = None
+    for i, record in enumerate(records):
+        if i == 0:
+            record["host"] = "sender"
+        elif i == len(records) - 1 and record["by"] is None:
+            record["host"] = "spider"
+        else:
+            record["host"] = record["by"] or record["from"] or "unknown"
+        record["delay"] = None
+        if record["timestamp"] is None:
+            continue
+        if previous is not None:
+            record["delay"] = record["timestamp"] - previous
+        previous = record["timestamp"]
+    return records
+
+
+def get_slowest_hop(records: [dict]) -> (str, float):
+    """Return the hop which took the longest.
+
+    :param records: the hop records of a message, as returned by parse_hops
+    :return: the host of the slowest hop and its delay in seconds, or (None, None) if no delay is known
+    """
+    delayed = [r for r in records if r["delay"] is not None]
+    if not delayed:
+        return None, None
+    slowest = max(delayed, key=lambda r: r["delay"])
+    return slowest["host"], slowest["delay"]
+
+
+def read_hops_file(path: str) -> {str: [str]}:
+    """Read the raw hops from a file test result CSV file.
+
+    :param path: path to a results/file-*.csv file
+    :return: a dictionary with the provider domains as keys and their hop strings as values
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [line.rstrip("\n").split(", ") for line in f]
+    providers = rows[0][1:]
+    hops = {provider: [] for provider in providers}
+    for row in rows[1:]:
+        if not (row[0].startswith("hop ") and row[0].endswith(":")):
+            continue
+        for provider, hop in zip(providers, row[1:]):
+            if hop.strip():
+                hops[provider].append(hop)
+    return hops
+
+
+def get_relay_stats(messages: [[dict]]) -> [list]:
+    """Aggregate the hop delays of many messages per relay host, slowest first.
+
+    All delays are first collected into two flat columns, hosts and delays; they are then grouped in a single pass.
+
+    :param messages: a list of hop record lists, as returned by parse_hops
+    :return: a list of [host, hops, mean, p50, p90, max] rows, sorted by their 90th percentile
+    """
+    hosts = []
+    delays = []
+    for records in messages:
+        for record in records:
+            if record["delay"] is not None:
+                hosts.append(record["host"])
+                delays.append(record["delay"])
+    grouped = {}
+    for host, delay in zip(hosts, delays):
+        grouped.setdefault(host, []).append(delay)
+    stats = []
+    for host, values in grouped.items():
+        stats.append([host, len(values), sum(values) / len(values),
+                      percentile(values, 50), percentile(values, 90), max(values)])
+    stats.sort(key=lambda row: row[4], reverse=True)
+    return stats
+
+
+def hopsreport(paths: [str]) -> [str]:
+    """Find the slowest relays across file test results.
+
+    :param paths: paths to results/file-*.csv files
+    :return: the report lines in CSV format
+    """
+    messages = []
+    for path in paths:
+        for provider, hops in read_hops_file(path).items():
+            if hops:
+                messages.append(parse_hops(hops))
+    lines = ["relay, hops, mean (in seconds), p50 (in seconds), p90 (in seconds), max (in seconds)"]
+    for row in get_relay_stats(messages):
+        lines.append("%s, %d, %.1f, %.1f, %.1f, %.1f" % tuple(row))
+    return lines
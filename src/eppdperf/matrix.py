@@ -0,0 +1,193 @@
+from array import array
+
+
+# status codes of a cell; codes greater than zero are interned values, e.g. error messages
+PENDING = 0
+OK = -1
+
+
+class ResultMatrix:
+    """The results of a test in which every test account sends to every other one, by receiver and sender.
+
+    The cells are kept in two flat arrays with one row per receiver: the durations in seconds as floats, and a
+    status code. A cell is either PENDING, OK with a duration, or holds a value like an error message; each distinct
+    value is only stored once and its cells refer to it by number. Counting the cells of a row or column is then
+    done by the array module in C, which keeps runs with a thousand test accounts fast and small.
+
+    :param addrs: the email addresses of the test accounts
+    """
+
+    def __init__(self, addrs: [str] = ()):
+        self.addrs = []
+        self.index = {}
+        self.capacity = 0
+        self.durations = array("d")
+        self.status = array("i")
+        self.done = array("l")
+        self.values = [None]
+        self.value_ids = {}
+        for addr in addrs:
+            self.add_addr(addr)
+
+    def __contains__(self, addr: str) -> bool:
+        return addr in self.index
+
+    def __len__(self) -> int:
+        return len(self.addrs)
+
+    def add_addr(self, addr: str) -> int:
+        """Add a row and a column for a test account. The arrays grow by doubling, so adding N test accounts costs
+        O(N²) in total.
+
+        :param addr: the email address of the test account
+        :return: the index of its row and column
+        """
+        if addr in self.index:
+            return self.index[addr]
+        if len(self.addrs) == self.capacity:
+            self.resize(max(8, self.capacity * 2))
+        self.index[addr] = len(self.addrs)
+        self.addrs.append(addr)
+        self.done.append(0)
+        return self.index[addr]
+
+    def resize(self, capacity: int):
+        """Copy the cells into arrays with room for more test accounts.
+
+        :param capacity: how many test accounts the new arrays can hold
+        """
+        durations = array("d", bytes(8 * capacity * capacity))
+        status = array("i", [PENDING]) * (capacity * capacity)
+        for i in range(len(self.addrs)):
+            old = i * self.capacity
+            new = i * capacity
+            durations[new:new + len(self.addrs)] = self.durations[old:old + len(self.addrs)]
+            status[new:new + len(self.addrs)] = self.status[old:old + len(self.addrs)]
+        self.durations = durations
+        self.status = status
+        self.capacity = capacity
+
+    def intern(self, value: str) -> int:
+        """Return the status code of a value, storing it if it was not seen before.
+
+        :param value: e.g. an error message
+        :return: its status code, greater than zero
+        """
+        code = self.value_ids.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.value_ids[value] = code
+        return code
+
+    def set(self, receiver: str, sender: str, result) -> int:
+        """Store the result of a message.
+
+        :param receiver: the email address which received the message
+        :param sender: the email address which sent the message
+        :param result: how long the message took in seconds; alternatively, a value like the error message
+        :return: how many results the row of the receiver has now
+        """
+        row = self.add_addr(receiver)
+        cell = row * self.capacity + self.add_addr(sender)
+        if self.status[cell] == PENDING:
+            self.done[row] += 1
+        if isinstance(result, float):
+            self.durations[cell] = result
+            self.status[cell] = OK
+        else:
+            self.status[cell] = self.intern(result)
+        return self.done[row]
+
+    def get(self, receiver: str, sender: str):
+        """Return the result of a message.
+
+        :param receiver: the email address which received the message
+        :param sender: the email address which sent the message
+        :return: the duration in seconds, the stored value, or None if there is no result yet
+        """
+        if receiver not in self.index or sender not in self.index:
+            return None
+        cell = self.index[receiver] * self.capacity + self.index[sender]
+        code = self.status[cell]
+        if code == OK:
+            return self.durations[cell]
+        return self.values[code]
+
+    def get_row(self, receiver: str) -> array:
+        """Return the status codes of the messages a test account received.
+
+        :param receiver: the email address of the receiver
+        :return: one status code per sender, in the order the test accounts were added
+        """
+        begin = self.index[receiver] * self.capacity
+        return self.status[begin:begin + len(self.addrs)]
+
+    def get_column(self, sender: str) -> array:
+        """Return the status codes of the messages a test account sent.
+
+        :param sender: the email address of the sender
+        :return: one status code per receiver, in the order the test accounts were added
+        """
+        column = self.index[sender]
+        return self.status[column:len(self.addrs) * self.capacity:self.capacity]
+
+    def get_pending(self, receiver: str) -> [str]:
+        """Return the test accounts from which a receiver has no result yet.
+
+        :param receiver: the email address of the receiver
+        :return: the email addresses of the senders, including the receiver itself
+        """
+        if receiver not in self.index:
+            return []
+        return [self.addrs[i] for i, code in enumerate(self.get_row(receiver)) if code == PENDING]
+
+    def count_received(self, receiver: str) -> int:
+        """Return how many results the row of a receiver has, successful or not.
+
+        :param receiver: the email address of the receiver
+        """
+        if receiver not in self.index:
+            return 0
+        return self.done[self.index[receiver]]
+
+    def count_ok_received(self, receiver: str) -> int:
+        """Return how many messages a test account received successfully.
+
+        :param receiver: the email address of the receiver
+        """
+        if receiver not in self.index:
+            return 0
+        return self.get_row(receiver).count(OK)
+
+    def count_ok_sent(self, sender: str) -> int:
+        """Return how many messages of a test account were received successfully.
+
+        :param sender: the email address of the sender
+        """
+        if sender not in self.index:
+            return 0
+        return self.get_column(sender).count(OK)
+
+    def count_values(self, receiver: str, predicate) -> int:
+        """Return how many stored values in the row of a receiver match a predicate. The predicate is evaluated
+        once per distinct value, not once per cell.
+
+        :param receiver: the email address of the receiver
+        :param predicate: a function which takes a stored value and returns a bool
+        """
+        if receiver not in self.index:
+            return 0
+        row = self.get_row(receiver)
+        return sum(row.count(code) for code in range(1, len(self.values)) if predicate(self.values[code]))
+
+    def get_sent_durations(self, sender: str) -> [float]:
+        """Return the durations of the messages of a test account which were received successfully.
+
+        :param sender: the email address of the sender
+        """
+        if sender not in self.index:
+            return []
+        column = self.index[sender]
+        return [self.durations[i * self.capacity + column] for i, code in enumerate(self.get_column(sender))
+                if code == OK]
@@ -1,8 +1,22 @@
 import os
-from threading import Event
+import time
+from threading import Event, Lock
 
 
-from .analysis import TESTED_CAPABILITIES
+from .authresults import AUTH_METHODS, parse_authentication_results, format_verdict
+from .hops import parse_hops, get_slowest_hop
+from .stats import percentile, median
+from .configstages import CONFIGURE_STAGES
+from .compare import is_latency_row, get_metric, SKIPPED_CELLS
+from .deadlines import get_domain
+from .storage import estimate_storage_time, MESSAGE_COMMITS
+from .matrix import ResultMatrix
+
+
+TESTED_CAPABILITIES = ("IDLE", "CONDSTORE", "QRESYNC", "COMPRESS=DEFLATE", "UIDPLUS", "MOVE")
+
+# the latency metrics which measure a message from sending to receiving, see compare.get_metric
+MESSAGE_METRICS = ("delivery", "sent ", "added to group", "fan-out")
 
 
 class Output:
@@ -17,23 +31,53 @@ class Output:
         self.overwrite = args.yes
         self.select = args.select
         self.accounts = []
+        self.accounts_lock = Lock()
+        self.setup_count = 0
         self.interop_senders = []
         self.logins = {}
         self.setups = {}
+        self.configure_stages = {}
+        self.dns_lookups = {}
         self.sending = {}
         self.groupadd = {}
-        self.groupmsgs = {}
-        self.interop = {}
-        self.dkimchecks = {}
+        self.groupmsgs = ResultMatrix()
+        self.group_members = []
+        self.group_chats = {}
+        self.group_begin = 0
+        self.groupscaling = {}
+        self.interop = ResultMatrix()
+        self.dkimchecks = ResultMatrix()
+        self.headers_file = None
+        self.headers_lock = Lock()
+        if getattr(args, "raw_headers", None) is not None:
+            self.headers_file = open(args.raw_headers, "w", encoding="utf-8")
         self.hops = {}
+        self.hop_records = {}
+        self.message_ids = {}
+        self.downloads = {}
+        self.download_bytes = {}
         self.recipients = {}
         self.quotas = {}
+        self.idle = {}
+        self.throughput_accepted = {}
+        self.throughput_delivered = {}
+        self.throttled = {}
+        self.throughput_failures = {}
+        self.throughput_sending_finished = False
         self.capabilities = {}
+        self.storage = getattr(args, "storage", "disk")
+        self.storage_latency = {}
+        self.storage_peak = None
+        self.reconnects = {}
+        self.sync = {}
+        self.spiders = {}
+        self.preflight = {}
         self.num_accounts = num_accounts
         self.groupadd_completed = Event()
         self.filetest_completed = Event()
         self.groupmsgs_completed = Event()
         self.interop_completed = Event()
+        self.throughput_completed = Event()
 
     def submit_login_result(self, addr: str, duration: float):
         """Submit to output how long the login took. Notifies main thread when all logins are complete.
@@ -41,10 +85,29 @@ class Output:
         :param addr: the email address which successfully logged in
         :param duration: seconds how long the login took
         """
-        self.accounts.append(addr)
-        self.logins[addr] = duration
-        self.groupmsgs[addr] = {}
-        self.dkimchecks[addr] = {}
+        # with --parallel, several accounts log in at the same time
+        with self.accounts_lock:
+            self.accounts.append(addr)
+            self.logins[addr] = duration
+            self.groupmsgs.add_addr(addr)
+            self.interop.add_addr(addr)
+            self.dkimchecks.add_addr(addr)
+
+    def count_setup(self) -> int:
+        """Count an account whose setup begins, for the progress messages.
+
+        :return: the number of the account, starting with 1
+        """
+        with self.accounts_lock:
+            self.setup_count += 1
+            return self.setup_count
+
+    def sort_accounts(self, addrs: [str]):
+        """Order the test accounts like in the accounts file, after they were set up in parallel.
+
+        :param addrs: the email addresses in the order of the accounts file
+        """
+        self.accounts = [addr for addr in addrs if addr in self.accounts]
 
     def submit_setup_result(self, addr: str, duration: float):
         """Submit to output how long the login took. Notifies main thread when all logins are complete.
@@ -54,18 +117,217 @@ class Output:
         """
         self.setups[addr] = duration
 
-    def submit_filetest_result(self, addr: str, sendduration: str, hops: list):
+    def submit_configure_stages(self, addr: str, stages: dict):
+        """Submit to output how long the stages of the first configuration took.
+
+        :param addr: the email address which was configured
+        :param stages: seconds spent in each of the configstages.CONFIGURE_STAGES
+        """
+        self.configure_stages[addr] = stages
+
+    def submit_dns_result(self, addr: str, duration: float):
+        """Submit to output how long the resolver took to look up the IMAP server of an account.
+
+        :param addr: the email address of the account
+        :param duration: seconds the lookup took, or None if it failed
+        """
+        self.dns_lookups[addr] = duration
+
+    def submit_filetest_result(self, addr: str, sendduration: str, hops: list, message_id: str = None):
         """Submit to output how long the file sending test took. Notifies main thread when all tests are complete.
 
         :param addr: the email address which successfully sent the file
         :param sendduration: seconds how long the file sending took
         :param hops: the parsed message info, containing hop data
+        :param message_id: the Message-ID of the received file message, used to download it again over IMAP
         """
         self.sending[addr] = sendduration
         self.hops[addr] = hops
+        self.hop_records[addr] = parse_hops(hops)
+        if message_id is not None:
+            self.message_ids[addr] = message_id
         if len(self.sending) == len(self.accounts):
             self.filetest_completed.set()
 
+    def submit_spider_assignment(self, addr: str, spider: str):
+        """Submit to output which spider account receives the messages of a test account.
+
+        :param addr: the email address of the test account
+        :param spider: the email address of the spider account
+        """
+        self.spiders[addr] = spider
+
+    def get_spider_median(self, addr: str) -> str:
+        """Return the median file test duration of all test accounts which sent to the same spider as addr. If
+        a test account is much slower than its spider's median, the delay is on the sender side rather than at the
+        spider.
+
+        :param addr: the email address of the test account
+        :return: the median in seconds, or "timeout" if no file arrived at the spider
+        """
+        durations = []
+        for sender, spider in self.spiders.items():
+            try:
+                if spider == self.spiders.get(addr):
+                    durations.append(float(self.sending[sender]))
+            except (KeyError, ValueError, TypeError):
+                continue
+        if not durations:
+            return "timeout"
+        return "%.2f" % (median(durations),)
+
+    def submit_preflight_result(self, addr: str, reason: str):
+        """Submit to output whether the test file of a test account can arrive at all.
+
+        :param addr: the email address of the test account
+        :param reason: why the file can not arrive, or None if it might
+        """
+        self.preflight[addr] = "ok" if reason is None else reason.replace(",", " ").replace(";", ".")
+
+    def submit_download_result(self, addr: str, mode: str, throughput: str, wire_bytes: int = None):
+        """Submit to output how fast the spider could download the file sent by addr over IMAP.
+
+        :param addr: the email address which sent the file
+        :param mode: "plain" or "deflate", whether COMPRESS=DEFLATE was enabled
+        :param throughput: download speed in MB/s; alternatively, the error message.
+        :param wire_bytes: how many bytes the server sent for the file, compressed in "deflate" mode
+        """
+        if throughput not in ("", "not supported", "not found"):
+            try:
+                float(throughput)
+            except ValueError:
+                print("[ERROR] %s: spider download failed (%s): %s" % (addr, mode, throughput))
+                throughput = throughput.replace(",", " ").replace(";", ".").replace("\n", " ")
+        d = self.downloads.setdefault(addr, {})
+        d[mode] = throughput
+        if wire_bytes is not None:
+            self.download_bytes.setdefault(addr, {})[mode] = wire_bytes
+
+    def submit_idle_result(self, addr: str, woken, fetched):
+        """Submit to output how long an IDLE push notification and the following fetch took.
+
+        :param addr: the email address which received the message
+        :param woken: seconds from SMTP acceptance until the IDLE connection woke up; alternatively, the error
+        :param fetched: seconds from SMTP acceptance until the message was fetched; alternatively, the error
+        """
+        self.idle.setdefault(addr, []).append((woken, fetched))
+        try:
+            print("%s: IDLE woke up after %.2f seconds, fetched after %.2f seconds" %
+                  (addr, float(woken), float(fetched)))
+        except ValueError:
+            print("[ERROR] %s: IDLE test failed: %s" % (addr, woken))
+
+    def submit_throughput_accepted(self, addr: str, rate: int, seq: int, accepted: float):
+        """Submit to output that the SMTP server accepted a throughput test message.
+
+        :param addr: the email address which sent the message
+        :param rate: the messages per minute of the ramp step
+        :param seq: the number of the message in the ramp step
+        :param accepted: timestamp when the SMTP server accepted the message
+        """
+        self.throughput_accepted.setdefault(addr, {}).setdefault(rate, {})[seq] = accepted
+
+    def submit_throughput_delivery(self, sender: str, rate: int, seq: int, received: float):
+        """Submit to output that the spider received a throughput test message. Notifies main thread when all
+        accepted messages arrived.
+
+        :param sender: the email address which sent the message
+        :param rate: the messages per minute of the ramp step
+        :param seq: the number of the message in the ramp step
+        :param received: timestamp when the spider received the message
+        """
+        self.throughput_delivered.setdefault(sender, {}).setdefault(rate, {})[seq] = received
+        self.check_throughput_completed()
+
+    def submit_throughput_throttled(self, addr: str, rate: int, error: str):
+        """Submit to output at which rate the SMTP server started to defer messages with a 4xx reply.
+
+        :param addr: the email address which sent the messages
+        :param rate: the messages per minute of the ramp step
+        :param error: the SMTP error
+        """
+        self.throttled[addr] = (rate, error.replace(",", " ").replace(";", ".").replace("\n", " "))
+        print("[ERROR] %s: throttled at %s messages per minute: %s" % (addr, rate, error))
+
+    def submit_throughput_failed(self, addr: str, rate: int, error: str):
+        """Submit to output that the throughput test of a test account ended with a permanent 5xx reply or a
+        failed connection, which does not tell whether the provider throttles.
+
+        :param addr: the email address which sent the messages
+        :param rate: the messages per minute of the ramp step, or 0 if the connection could not be established
+        :param error: the SMTP or connection error
+        """
+        self.throughput_failures[addr] = (rate, error.replace(",", " ").replace(";", ".").replace("\n", " "))
+        print("[ERROR] %s: failed at %s messages per minute: %s" % (addr, rate, error))
+
+    def finish_throughput_sending(self):
+        """Notify output that no more throughput test messages will be sent.
+        """
+        self.throughput_sending_finished = True
+        self.check_throughput_completed()
+
+    def check_throughput_completed(self):
+        """Notify main thread if all accepted throughput test messages arrived at the spider.
+        """
+        if not self.throughput_sending_finished:
+            return
+        for addr, steps in self.throughput_accepted.items():
+            for rate, accepted in steps.items():
+                if len(self.throughput_delivered.get(addr, {}).get(rate, {})) < len(accepted):
+                    return
+        self.throughput_completed.set()
+
+    def get_throughput_stats(self, addr: str, rate: int) -> (str, str, str):
+        """Return the accepted and delivered messages per minute and the mean queue delay of a ramp step.
+
+        :param addr: the email address which sent the messages
+        :param rate: the messages per minute of the ramp step
+        :return: accepted rate, delivered rate, mean queue delay in seconds; empty strings if not measured
+        """
+        accepted = self.throughput_accepted.get(addr, {}).get(rate, {})
+        delivered = self.throughput_delivered.get(addr, {}).get(rate, {})
+        if not accepted:
+            return "", "", ""
+        acceptedrate = get_rate(list(accepted.values()))
+        deliveredrate = get_rate(list(delivered.values()))
+        delays = [delivered[seq] - accepted[seq] for seq in delivered if seq in accepted]
+        if delays:
+            delay = "%.2f" % (sum(delays) / len(delays),)
+        else:
+            delay = "timeout"
+        return acceptedrate, deliveredrate, delay
+
+    def submit_reconnect_result(self, addr: str, protocol: str, mode: str, duration: float, reused: bool = False):
+        """Submit to output how long a connection took.
+
+        :param addr: the email address of the test account
+        :param protocol: "IMAP" or "SMTP"
+        :param mode: "cold" for a new TLS session, "warm" for a resumed one, "reused" for a NOOP on an open
+            connection
+        :param duration: seconds until the connection was ready
+        :param reused: whether the TLS session was actually resumed
+        """
+        durations, resumed = self.reconnects.setdefault(addr, {}).get((protocol, mode), ([], 0))
+        durations.append(duration)
+        self.reconnects[addr][(protocol, mode)] = (durations, resumed + int(reused))
+
+    def submit_sync_result(self, addr: str, mode: str, compression: str, result):
+        """Submit to output how long a folder resync took and how many bytes were downloaded.
+
+        :param addr: the email address of the test account
+        :param mode: "full", "CONDSTORE", or "QRESYNC"
+        :param compression: "plain" or "deflate"
+        :param result: seconds and bytes of the resync; alternatively, the error message
+        """
+        if isinstance(result, tuple):
+            print("%s: %s resync (%s) took %.2f seconds, %s bytes" % (addr, mode, compression, result[0], result[1]))
+        elif result == "not supported":
+            print("%s: %s resync (%s) not supported" % (addr, mode, compression))
+        else:
+            print("[ERROR] %s: %s resync (%s) failed: %s" % (addr, mode, compression, result))
+            result = result.replace(",", " ").replace(";", ".").replace("\n", " ")
+        self.sync.setdefault(addr, {})[(mode, compression)] = result
+
     def submit_recipients_result(self, addr: str, num: str):
         """Submit to output how many recipients this addr succeeded to write to.
 
@@ -91,41 +353,89 @@ class Output:
         caps = self.capabilities.setdefault(addr, {})
         caps[capability] = supported
 
-    def submit_groupadd_result(self, addr: str, duration: float):
+    def start_group_round(self, members: [str]):
+        """Reset the group test results before a new group is created.
+
+        :param members: the email addresses of the test accounts which are added to the group
+        """
+        self.group_members = members
+        self.group_begin = time.time()
+        self.groupadd = {}
+        self.groupmsgs = ResultMatrix(members)
+        self.group_chats = {}
+        self.groupadd_completed.clear()
+        self.groupmsgs_completed.clear()
+
+    def finish_group_round(self, size: int):
+        """Keep the results of a group test round for the group scaling output.
+
+        :param size: how many test accounts were members of the group
+        """
+        self.groupscaling[size] = (self.groupadd, self.groupmsgs)
+
+    def submit_groupadd_result(self, addr: str, duration: float, chat_id: int = None):
         """Submit to output how long the group add took. Notifies main thread when all test accounts are in the group.
 
         :param addr: the email address which was successfully added
         :param duration: seconds how long the group add took
+        :param chat_id: the ID of the group chat in the account of addr
         """
         self.groupadd[addr] = duration
-        if len(self.groupadd) == len(self.accounts):
+        self.group_chats[addr] = chat_id
+        if len(self.groupadd) == len(self.group_members):
             self.groupadd_completed.set()
 
-    def submit_groupmsg_result(self, addr: str, sender: str, duration: float):
+    def submit_groupmsg_result(self, addr: str, sender: str, duration: float, begin: float = None):
         """Submit to output how long a group message took. Notifies main thread when all test messages arrived.
 
         :param addr: the email address which received the group message
         :param sender: the email address which sent the group message
         :param duration: seconds how long the message took
+        :param begin: when the message was sent, to ignore late messages of a previous group
         """
-        self.groupmsgs[addr][sender] = duration
-        for receiver in self.groupmsgs:
-            if len(self.groupmsgs[receiver]) != len(self.accounts) - 1:
+        if addr not in self.groupmsgs or sender not in self.groupmsgs:
+            return  # not a member of the current group
+        if begin is not None and begin < self.group_begin:
+            return  # message was sent to the group of a previous round
+        if self.groupmsgs.set(addr, sender, duration) < len(self.group_members) - 1:
+            return  # only check the other receivers when this one is complete
+        for receiver in self.group_members:
+            if self.groupmsgs.count_received(receiver) != len(self.group_members) - 1:
                 return
         self.groupmsgs_completed.set()
 
-    def submit_dkimchecks_result(self, receiver: str, sender: str, content: str):
-        """Submit to output the MIME headers of a received message. Notifies the main thread when all test messages arrived.
+    def get_fanout_duration(self, sender: str, groupmsgs: ResultMatrix):
+        """Return how long it took until a group message reached all other members.
+
+        :param sender: the email address which sent the group message
+        :param groupmsgs: the group message results of one group
+        :return: the duration in seconds until the last member received it, or "timeout"
+        """
+        durations = groupmsgs.get_sent_durations(sender)
+        if not durations or len(durations) < len(groupmsgs) - 1:
+            return "timeout"
+        return "%.2f" % (max(durations),)
+
+    def submit_dkimchecks_result(self, receiver: str, sender: str, headers):
+        """Submit to output the authentication results of a received message. Only the parsed verdicts are kept in
+        memory; the raw headers are written to the --raw_headers file, if given. Notifies the main thread when all
+        test messages arrived.
 
         :param receiver: the email address which received the test message
         :param sender: the email address which sent the test message
-        :param content: the MIME headers of the message
+        :param headers: the MIME headers of the message, an email.message.Message
         """
-        content_csv = content.replace(",", " ").replace(";", ".").replace("\n", " ")
-        self.dkimchecks[receiver][sender] = content_csv
-        print(content_csv)
-        for receiver in self.dkimchecks:
-            if len(self.dkimchecks[receiver]) != len(self.accounts) - 1:
+        verdict = format_verdict(parse_authentication_results(headers))
+        received = self.dkimchecks.set(receiver, sender, verdict)
+        print("%s -> %s: %s" % (sender, receiver, verdict))
+        if self.headers_file is not None:
+            with self.headers_lock:
+                self.headers_file.write("From %s to %s\n%s\n" % (sender, receiver, headers.as_string()))
+                self.headers_file.flush()
+        if received < len(self.accounts) - 1:
+            return  # only check the other receivers when this one is complete
+        for receiver in self.accounts:
+            if self.dkimchecks.count_received(receiver) != len(self.accounts) - 1:
                 return
         self.interop_completed.set()
 
@@ -136,22 +446,96 @@ class Output:
         :param sender: the email address which sent the test message
         :param duration: how long the message took in seconds; alternatively, the error message.
         """
-        d = self.interop.setdefault(receiver, {})
-        d[sender] = duration
         try:
-            print("%s -> %s: %.2f seconds" % (sender, receiver, float(duration)))
+            duration = float(duration)
+            print("%s -> %s: %.2f seconds" % (sender, receiver, duration))
         except ValueError:
             print("[ERROR] %s -> %s\n%s" % (sender, receiver, duration))
-            d[sender] = duration.replace(",", " ").replace(";", ".").replace("\n", " ")
+            duration = duration.replace(",", " ").replace(";", ".").replace("\n", " ")
+        if self.interop.set(receiver, sender, duration) < self.get_expected_interop(receiver):
+            return  # only check the other receivers when this one is complete
         for rec in self.accounts:
-            if self.interop.get(rec) is None:
-                return  # no results for receiver yet
-            if rec not in self.interop_senders and len(self.interop[rec]) < len(self.interop_senders):
+            if self.interop.count_received(rec) < self.get_expected_interop(rec):
                 return  # receiver has not gotten message from all senders
-            if rec in self.interop_senders and len(self.interop[rec]) < len(self.interop_senders) - 1:
-                return  # receiver was also a sender, but hasn't gotten message from all other senders
         self.interop_completed.set()
 
+    def get_expected_interop(self, receiver: str) -> int:
+        """Return how many interop messages a test account should receive.
+
+        :param receiver: the email address of the receiver
+        :return: the number of senders, without the receiver itself
+        """
+        if receiver in self.interop_senders:
+            return len(self.interop_senders) - 1
+        return len(self.interop_senders)
+
+    def get_outstanding(self) -> [(str, str)]:
+        """Return which messages of the current file, group, interop, or dkimchecks test did not arrive yet.
+
+        :return: (receiver, sender) tuples; the spider is None
+        """
+        if self.command == "file":
+            return [(None, addr) for addr in self.accounts if addr not in self.sending]
+        if self.command == "group":
+            members = self.group_members
+            outstanding = [(addr, None) for addr in members if addr not in self.groupadd]
+            for receiver in members:
+                if self.groupmsgs.count_received(receiver) < len(members) - 1:
+                    outstanding.extend((receiver, sender) for sender in self.groupmsgs.get_pending(receiver)
+                                       if sender != receiver)
+            return outstanding
+        results = self.dkimchecks if self.command == "dkimchecks" else self.interop
+        senders = set(self.interop_senders)
+        outstanding = []
+        for receiver in self.accounts:
+            if results.count_received(receiver) < self.get_expected_interop(receiver):
+                outstanding.extend((receiver, sender) for sender in results.get_pending(receiver)
+                                   if sender != receiver and sender in senders)
+        return outstanding
+
+    def get_progress(self) -> (int, int, {str: int}):
+        """Return how far the current file, group, interop, or dkimchecks test got.
+
+        :return: how many results arrived, how many are expected, and how many are still outstanding per test
+            account
+        """
+        outstanding = {}
+        if self.command == "file":
+            for addr in self.accounts:
+                outstanding[addr] = 0 if addr in self.sending else 1
+            return len(self.sending), len(self.accounts), outstanding
+        if self.command == "group":
+            members = self.group_members
+            for addr in members:
+                outstanding[addr] = int(addr not in self.groupadd) + \
+                    len(members) - 1 - self.groupmsgs.count_received(addr)
+            expected = len(members) * len(members)
+            return expected - sum(outstanding.values()), expected, outstanding
+        results = self.dkimchecks if self.command == "dkimchecks" else self.interop
+        expected = 0
+        for addr in self.accounts:
+            outstanding[addr] = max(0, self.get_expected_interop(addr) - results.count_received(addr))
+            expected += self.get_expected_interop(addr)
+        return expected - sum(outstanding.values()), expected, outstanding
+
+    def store_storage_latency(self, location: str, commit: float, blobwrite: float):
+        """Store how long local writes take, to tell local storage latency apart from network latency.
+
+        :param location: "disk" or "ram"
+        :param commit: median seconds of a database commit
+        :param blobwrite: median seconds of writing and syncing a 1 MB blob
+        """
+        self.storage_latency[location] = (commit, blobwrite)
+        print("local storage on %s: %.2f ms per database commit, %.2f ms per 1 MB blob" %
+              (location, commit * 1000, blobwrite * 1000))
+
+    def store_storage_peak(self, size: int):
+        """Store how large the in-memory account data grew during the run.
+
+        :param size: the largest size of the account data directory in bytes
+        """
+        self.storage_peak = size
+
     def store_file_size(self, filesize: str):
         """Store file size in Output object. Insert file size into output file name
 
@@ -161,40 +545,24 @@ class Output:
         parts = self.outputfile[::-1].partition(".")
         self.outputfile = "%s-%s.%s" % (parts[2][::-1], filesize, parts[0][::-1])
 
-    def get_sent_percentage(self, sender: str, results: {dict}) -> float:
+    def get_sent_percentage(self, sender: str, results: ResultMatrix) -> float:
         """Return the % of successfully sent messages for a specific sender.
 
         :param sender: the email address of the sender
         :param results: the results of the group or interop test
         :return: the percentage of successful messages/other test accounts, between 0 and 100.
         """
-        success = 0
-        for receiver in results:
-            result = results[receiver].get(sender)
-            try:
-                float(result)
-                success += 1
-            except ValueError:
-                continue
-            except TypeError:
-                continue
+        success = results.count_ok_sent(sender)
         return (success / (len(self.accounts) - 1)) * 100
 
-    def get_received_percentage(self, receiver: str, results: dict) -> float:
+    def get_received_percentage(self, receiver: str, results: ResultMatrix) -> float:
         """Return the % of successfully received messages for a specific receiver.
 
-        :param results: the results of the receiver
+        :param receiver: the email address of the receiver
+        :param results: the results of the group or interop test
         :return: the percentage of successful messages/other test accounts, between 0 and 100.
         """
-        success = 0
-        for result in results:
-            try:
-                float(results[result])
-                success += 1
-            except ValueError:
-                continue
-            except TypeError:
-                continue
+        success = results.count_ok_received(receiver)
         if self.command == "interop" and receiver in self.interop_senders:
             return (success / (len(self.interop_senders) - 1)) * 100
         elif self.command == "interop" and receiver not in self.interop_senders:
@@ -202,6 +570,19 @@ class Output:
         else:
             return (success / (len(self.accounts) - 1)) * 100
 
+    def get_idle_percentile(self, addr: str, index: int, p: int) -> str:
+        """Return a percentile of the IDLE test results of a test account.
+
+        :param addr: the email address of the test account
+        :param index: 0 for the IDLE wake-up delay, 1 for the fetch delay
+        :param p: the percentile, between 0 and 100
+        :return: the percentile in seconds, or "timeout" if no message arrived
+        """
+        durations = [r[index] for r in self.idle.get(addr, []) if isinstance(r[index], float)]
+        if not durations:
+            return "timeout"
+        return "%.2f" % (percentile(durations, p),)
+
     def write(self):
         """Write the results to the output file.
         """
@@ -225,6 +606,19 @@ class Output:
                     except KeyError:
                         lines[i].append("already configured")
                 i += 1
+                for stage in CONFIGURE_STAGES:
+                    lines.append(["configuration: %s (in seconds):" % (stage,)])
+                    for addr in self.accounts:
+                        try:
+                            lines[i].append("%.2f" % (self.configure_stages[addr][stage],))
+                        except KeyError:
+                            lines[i].append("already configured")
+                    i += 1
+            lines.append(["DNS lookup of IMAP server (in seconds):"])
+            for addr in self.accounts:
+                duration = self.dns_lookups.get(addr)
+                lines[i].append("failed" if duration is None else "%.3f" % (duration,))
+            i += 1
             lines.append(["time to login (in seconds):"])
             for addr in self.accounts:
                 lines[i].append(self.logins[addr])
@@ -239,6 +633,68 @@ class Output:
                 for addr in self.accounts:
                     lines[i+2].append(int(self.capabilities[addr][cap]))
 
+        if self.command == "idle":
+            lines.append(["received IDLE pushes:"])
+            for addr in self.accounts:
+                results = self.idle.get(addr, [])
+                pushed = len([r for r in results if isinstance(r[0], float)])
+                lines[1].append("%s/%s" % (pushed, len(results)))
+            for index, name in enumerate(("IDLE wake-up", "fetch completed")):
+                for p in (50, 90, 99):
+                    i = len(lines)
+                    lines.append(["%s p%s (in seconds):" % (name, p)])
+                    for addr in self.accounts:
+                        lines[i].append(self.get_idle_percentile(addr, index, p))
+
+        if self.command == "throughput":
+            lines.append(["throttled at (messages per minute):"])
+            for addr in self.accounts:
+                if addr in self.throttled:
+                    lines[1].append("%s: %s" % self.throttled[addr])
+                elif addr in self.throughput_failures:
+                    lines[1].append("")
+                else:
+                    lines[1].append("not throttled")
+            lines.append(["failed at (messages per minute):"])
+            for addr in self.accounts:
+                lines[2].append("%s: %s" % self.throughput_failures[addr] if addr in self.throughput_failures else "")
+            rates = sorted({rate for steps in self.throughput_accepted.values() for rate in steps})
+            for rate in rates:
+                stats = {addr: self.get_throughput_stats(addr, rate) for addr in self.accounts}
+                for index, name in enumerate(("accepted per minute", "delivered per minute",
+                                              "mean queue delay (in seconds)")):
+                    i = len(lines)
+                    lines.append(["%s at %s/min:" % (name, rate)])
+                    for addr in self.accounts:
+                        lines[i].append(stats[addr][index])
+
+        if self.command == "reconnect":
+            for protocol in ("IMAP", "SMTP"):
+                i = len(lines)
+                lines.append(["%s TLS sessions resumed:" % (protocol,)])
+                for addr in self.accounts:
+                    durations, resumed = self.reconnects.get(addr, {}).get((protocol, "warm"), ([], 0))
+                    lines[i].append("%s/%s" % (resumed, len(durations)))
+                for mode in ("cold", "warm", "reused"):
+                    for p in (50, 90):
+                        i = len(lines)
+                        lines.append(["%s %s p%s (in seconds):" % (protocol, mode, p)])
+                        for addr in self.accounts:
+                            durations, _ = self.reconnects.get(addr, {}).get((protocol, mode), ([], 0))
+                            lines[i].append("%.3f" % (percentile(durations, p),) if durations else "failed")
+
+        if self.command == "sync":
+            for mode in ("full", "CONDSTORE", "QRESYNC"):
+                for compression in ("plain", "deflate"):
+                    for index, unit in enumerate(("in seconds", "in KB")):
+                        i = len(lines)
+                        lines.append(["%s resync %s (%s):" % (mode, compression, unit)])
+                        for addr in self.accounts:
+                            result = self.sync.get(addr, {}).get((mode, compression), "")
+                            if isinstance(result, tuple):
+                                result = "%.2f" % (result[0],) if index == 0 else "%.1f" % (result[1] / 1024,)
+                            lines[i].append(result)
+
         if self.command == "recipients":
             lines.append(["maximum recipients:"])
             for addr in self.accounts:
@@ -254,23 +710,77 @@ class Output:
                     lines[1].append(self.sending[addr])
                 except KeyError:
                     lines[1].append("timeout")
+            if self.preflight:
+                i = len(lines)
+                lines.append(["pre-flight check:"])
+                for addr in self.accounts:
+                    lines[i].append(self.preflight.get(addr, ""))
+            if len(set(self.spiders.values())) > 1:
+                i = len(lines)
+                lines.append(["median of all senders to the same spider (in seconds):"])
+                for addr in self.accounts:
+                    lines[i].append(self.get_spider_median(addr))
+            for mode, title in (("plain", "spider download (in MB/s):"),
+                                ("deflate", "spider download with COMPRESS=DEFLATE (in MB/s):")):
+                i = len(lines)
+                lines.append([title])
+                for addr in self.accounts:
+                    lines[i].append(self.downloads.get(addr, {}).get(mode, ""))
+            for mode, title in (("plain", "spider download on the wire (in MB):"),
+                                ("deflate", "spider download on the wire with COMPRESS=DEFLATE (in MB):")):
+                i = len(lines)
+                lines.append([title])
+                for addr in self.accounts:
+                    wire_bytes = self.download_bytes.get(addr, {}).get(mode)
+                    lines[i].append("" if wire_bytes is None else "%.2f" % (wire_bytes / (1024 * 1024),))
             row = 0
+            first = len(lines)
             while True:
                 onemorerow = False
                 lines.append(["hop %s:" % (row + 1,)])
                 for addr in self.accounts:
                     try:
                         hop = self.hops[addr][row].replace(",", "").replace(";", "")
-                        lines[row + 2].append(hop)
+                        lines[first + row].append(hop)
                         onemorerow = True
                     except (KeyError, IndexError):
-                        lines[row + 2].append("")
+                        lines[first + row].append("")
                 if not onemorerow:
                     break
                 row += 1
-            del lines[row + 2]
+            del lines[first + row]
+            i = len(lines)
+            lines.append(["slowest hop (in seconds):"])
+            for addr in self.accounts:
+                host, delay = get_slowest_hop(self.hop_records.get(addr, []))
+                lines[i].append("" if host is None else "%s: %.0f" % (host, delay))
+            for hop in range(1, row):
+                i = len(lines)
+                lines.append(["delay before hop %s (in seconds):" % (hop + 1,)])
+                for addr in self.accounts:
+                    try:
+                        delay = self.hop_records[addr][hop]["delay"]
+                    except (KeyError, IndexError):
+                        delay = None
+                    lines[i].append("" if delay is None else "%.0f" % (delay,))
 
-        if self.command == "group":
+        if self.command == "group" and self.groupscaling:
+            for size, (groupadd, groupmsgs) in sorted(self.groupscaling.items()):
+                i = len(lines)
+                lines.append(["added to group of %s (in seconds):" % (size,)])
+                for addr in self.accounts:
+                    if addr not in groupmsgs:
+                        lines[i].append("")
+                    elif addr not in groupadd:
+                        lines[i].append("timeout")
+                    else:
+                        lines[i].append("%.2f" % (groupadd[addr],))
+                i = len(lines)
+                lines.append(["fan-out to group of %s (in seconds):" % (size,)])
+                for addr in self.accounts:
+                    lines[i].append(self.get_fanout_duration(addr, groupmsgs) if addr in groupmsgs else "")
+
+        if self.command == "group" and not self.groupscaling:
             lines.append(["added to group (in seconds):"])
             for addr in self.accounts:
                 if addr not in self.groupadd:
@@ -286,23 +796,17 @@ class Output:
             i = len(lines)
             lines.append(["received messages from other providers:"])
             for receiver in self.accounts:
-                try:
-                    lines[i].append(str(self.get_received_percentage(receiver, self.groupmsgs[receiver])) + "%")
-                except KeyError:
-                    lines[i].append("0%")
+                lines[i].append(str(self.get_received_percentage(receiver, self.groupmsgs)) + "%")
 
             for addr in self.accounts:
                 i = len(lines)
                 lines.append(["received by %s (in seconds):" % (addr.split("@")[1],)])
-                groupresults = self.groupmsgs.get(addr)
                 for ac in self.accounts:
                     if addr == ac:
                         lines[i].append("self")
                         continue
-                    try:
-                        lines[i].append(groupresults[ac])
-                    except KeyError:
-                        lines[i].append("timeout")
+                    result = self.groupmsgs.get(addr, ac)
+                    lines[i].append("timeout" if result is None else result)
 
         if self.command == "interop" or self.command == "dkimchecks":
             i = 1
@@ -312,13 +816,11 @@ class Output:
                     if sender == receiver:
                         lines[i].append("self")
                     else:
-                        try:
-                            if self.command == "interop":
-                                lines[i].append(self.interop[receiver][sender])
-                            elif self.command == "dkimchecks":
-                                lines[i].append(self.dkimchecks[receiver][sender])
-                        except KeyError:
-                            lines[i].append("timeout")
+                        if self.command == "interop":
+                            result = self.interop.get(receiver, sender)
+                        else:
+                            result = self.dkimchecks.get(receiver, sender)
+                        lines[i].append("timeout" if result is None else result)
                 i += 1
             if self.command == "interop":
                 lines.append(["could send messages to other providers:"])
@@ -331,10 +833,33 @@ class Output:
                         lines[i].append(receiver.split("@")[1])
                 lines.append(["received messages from other providers:"])
                 for receiver in self.accounts:
-                    try:
-                        lines[i+1].append(str(self.get_received_percentage(receiver, self.interop[receiver])) + "%")
-                    except KeyError:
-                        lines[i + 1].append("0%")
+                    lines[i+1].append(str(self.get_received_percentage(receiver, self.interop)) + "%")
+            if self.command == "dkimchecks":
+                for method in AUTH_METHODS:
+                    i = len(lines)
+                    lines.append(["received with %s=pass:" % (method,)])
+                    passing = "%s=pass" % (method,)
+                    for receiver in self.accounts:
+                        passed = self.dkimchecks.count_values(receiver, lambda v: passing in v.split(" "))
+                        lines[i].append("%s/%s" % (passed, self.dkimchecks.count_received(receiver)))
+
+        if len(set(self.spiders.values())) > 1:
+            i = len(lines)
+            lines.append(["spider:"])
+            for addr in self.accounts:
+                lines[i].append(self.spiders.get(addr, "").split("@")[-1])
+
+        if self.headers_file is not None:
+            self.headers_file.close()
+
+        storagelines = None
+        if self.storage_latency:
+            storagelines = self.get_storage_lines(lines)
+
+        domains = lines[0][1:]
+        domainlines = None
+        if len(set(domains)) < len(domains):
+            domainlines = self.get_domain_lines(lines)
 
         # print output
         for i in range(len(lines)):
@@ -342,16 +867,156 @@ class Output:
         out = "\n".join(lines)
         print("Test results in csv format:")
         print(out)
+        self.write_file(self.outputfile, out)
+
+        if domainlines is not None:
+            out = "\n".join(", ".join(map(str, line)) for line in domainlines)
+            print("Test results per provider in csv format:")
+            print(out)
+            parts = self.outputfile[::-1].partition(".")
+            self.write_file("%s-providers.%s" % (parts[2][::-1], parts[0][::-1]), out)
+
+        if storagelines is not None:
+            out = "\n".join(", ".join(map(str, line)) for line in storagelines)
+            print("Local storage latency in csv format:")
+            print(out)
+            parts = self.outputfile[::-1].partition(".")
+            self.write_file("%s-storage.%s" % (parts[2][::-1], parts[0][::-1]), out)
+
+    def get_storage_lines(self, lines: [list]) -> [list]:
+        """Split the measured message latencies into local storage and network time.
+
+        The local storage time of a message is estimated from the storage latencies measured at the start with the
+        model of storage.estimate_storage_time; the rest of the median is attributed to the network. Both columns
+        are labelled as estimates, as deltachat's own writes are not measured.
+
+        :param lines: the result rows with one column per account
+        :return: rows with the storage latency of each location, and for each message latency metric its median,
+            the estimated local storage time in the location which was used and on disk, and the network time
+        """
+        locations = sorted(self.storage_latency)
+        storagelines = [["local storage:"] + locations]
+        for index, name in enumerate(("database commit", "1 MB blob write")):
+            storagelines.append(["%s (in ms):" % (name,)])
+            for location in locations:
+                storagelines[-1].append("%.2f" % (self.storage_latency[location][index] * 1000,))
+        if self.storage_peak is not None:
+            storagelines.append(["peak account data (in MB):", "%.1f" % (self.storage_peak / (1024 * 1024),)])
+
+        durations = {}
+        for line in lines[1:]:
+            metric = get_metric(line[0])
+            if not is_latency_row(line[0]) or not metric.startswith(MESSAGE_METRICS):
+                continue
+            for cell in line[1:]:
+                try:
+                    durations.setdefault(metric, []).append(float(cell))
+                except (ValueError, TypeError):
+                    continue
+        storagelines.append(["estimate model:", "%s database commits per message and the attachment written by "
+                             "sender and receiver; the rest of the median counts as network" % (MESSAGE_COMMITS,)])
+        storagelines.append(["metric", "median (in seconds)",
+                             "estimated local storage on %s (in seconds)" % (self.storage,),
+                             "estimated local storage on disk (in seconds)", "estimated network (in seconds)"])
+        for metric, values in durations.items():
+            megabytes = 0.0
+            if metric.startswith("sent "):
+                megabytes = parse_megabytes(self.filesize)
+            storage = estimate_storage_time(*self.storage_latency[self.storage], megabytes)
+            disk = estimate_storage_time(*self.storage_latency["disk"], megabytes)
+            total = median(values)
+            storagelines.append([metric.replace(" (in seconds)", ""), "%.2f" % (total,), "%.3f" % (storage,),
+                                 "%.3f" % (disk,), "%.2f" % (max(0.0, total - storage),)])
+        return storagelines
+
+    def get_domain_lines(self, lines: [list]) -> [list]:
+        """Aggregate the results of several accounts at the same provider.
+
+        The "Received by" rows of the interop test are merged by the receiving provider first, so e.g. the
+        "Received by example.org" row pools the delivery times to all accounts at example.org.
+
+        :param lines: the result rows with one column per account; the first row has the domains
+        :return: result rows with one column per domain: the number of accounts, and for each row with durations,
+            including the merged "Received by" rows, how many accounts succeeded, and the median and 90th percentile
+        """
+        domains = lines[0][1:]
+        unique = sorted(set(domains), key=domains.index)
+        domainlines = [["test accounts (by provider):"] + unique, ["accounts:"]]
+        for domain in unique:
+            domainlines[1].append(domains.count(domain))
+        merged = {}
+        for line in lines[1:]:
+            if not is_latency_row(line[0]):
+                continue
+            receiver = get_domain(line[0])
+            # e.g. "sent 10MB file (in seconds)" or "Received by example.org"
+            title = line[0].rstrip(":").replace(" (in seconds)", "") if receiver is None else "Received by " + receiver
+            merged.setdefault(title, []).append(line[1:])
+        for title, cells in merged.items():
+            successes = [title + " successes:"]
+            p50 = [title + " p50 (in seconds):"]
+            p90 = [title + " p90 (in seconds):"]
+            for domain in unique:
+                durations = []
+                measured = 0
+                for row in cells:
+                    for cell, celldomain in zip(row, domains):
+                        if celldomain != domain or str(cell) in SKIPPED_CELLS:
+                            continue
+                        measured += 1
+                        try:
+                            durations.append(float(cell))
+                        except (ValueError, TypeError):
+                            continue
+                if measured == 0:
+                    # e.g. the receiver's own column in the interop test
+                    successes.append("")
+                    p50.append("")
+                    p90.append("")
+                    continue
+                successes.append("%s/%s" % (len(durations), measured))
+                p50.append("%.2f" % (percentile(durations, 50),) if durations else "failed")
+                p90.append("%.2f" % (percentile(durations, 90),) if durations else "failed")
+            domainlines.extend([successes, p50, p90])
+        return domainlines
 
+    def write_file(self, path: str, out: str):
+        """Write results to a file, asking before an existing file is overwritten.
+
+        :param path: the output file
+        :param out: the results in CSV format
+        """
         try:
-            f = open(self.outputfile, "x", encoding="utf-8")
+            f = open(path, "x", encoding="utf-8")
         except FileExistsError:
             if not self.overwrite:
-                answer = input(self.outputfile + " already exists. Do you want to overwrite it? [Y/n] ")
+                answer = input(path + " already exists. Do you want to overwrite it? [Y/n] ")
                 if answer.lower() == "n":
                     return
-            os.system("rm " + self.outputfile)
-            f = open(self.outputfile, "x", encoding="utf-8")
-        print("Writing results to %s" % (self.outputfile,))
+            os.system("rm " + path)
+            f = open(path, "x", encoding="utf-8")
+        print("Writing results to %s" % (path,))
         f.write(out)
         f.close()
+
+
+def get_rate(timestamps: [float]) -> str:
+    """Return how many events per minute happened, based on their timestamps.
+
+    :param timestamps: the times of the events
+    :return: events per minute, or an empty string if there were less than two events
+    """
+    if len(timestamps) < 2 or max(timestamps) == min(timestamps):
+        return ""
+    return "%.1f" % ((len(timestamps) - 1) / (max(timestamps) - min(timestamps)) * 60,)
+
+
+def parse_megabytes(filesize: str) -> float:
+    """Parse the size of the test file as stored by Output.store_file_size.
+
+    :param filesize: e.g. "10MB" or "400KB"
+    :return: the size in MB
+    """
+    if filesize.endswith("KB"):
+        return int(filesize[:-2]) / 1024
+    return float(filesize[:-2])
@@ -16,7 +16,7 @@ class Plugin:
         self.imap_connected = threading.Event()
         self.classtype = classtype
         self.quiet = quiet
-
+        self.configure_events = None
 
     @deltachat.account_hookimpl
     def ac_process_ffi_event(self, ffi_event):
@@ -26,6 +26,10 @@ class Plugin:
         """
         if ffi_event.name == "DC_EVENT_IMAP_CONNECTED":
             self.imap_connected.set()
+        if self.configure_events is not None and \
+                ffi_event.name in ("DC_EVENT_INFO", "DC_EVENT_CONFIGURE_PROGRESS"):
+            # collected while the account is configured, see analysis.setup_account
+            self.configure_events.append((time.time(), str(ffi_event.data2)))
 
         if self.quiet:
             return  # suppress log output
@@ -53,7 +57,7 @@ class TestPlugin(Plugin):
 
     def __init__(self, account: deltachat.Account, output, begin, classtype="test account", quiet=False):
         super().__init__(account, output, begin, classtype, quiet)
-        self.group = ""
+        self.group_chat_id = None
 
     @deltachat.account_hookimpl
     def ac_incoming_message(self, message: deltachat.Message):
@@ -83,13 +87,13 @@ class TestPlugin(Plugin):
             if author == "spider":
                 print("%s: joined group chat %s after %.1f seconds" % (selfaddr, message.chat.get_name(), duration))
                 message.chat.send_text("Sender: %s\nBegin: %s" % (selfaddr, str(time.time())))
-                self.output.submit_groupadd_result(self.account.get_self_contact().addr, duration)
-                self.group = message.chat.get_name()
+                self.group_chat_id = message.chat.id
+                self.output.submit_groupadd_result(self.account.get_self_contact().addr, duration, message.chat.id)
             else:
-                if message.chat.get_name() == self.group:
+                if message.chat.id == self.group_chat_id:
                     print("%s received message from %s after %.1f seconds" %
                           (selfaddr, author, duration))
-                    self.output.submit_groupmsg_result(selfaddr, author, duration)
+                    self.output.submit_groupmsg_result(selfaddr, author, duration, msgcontent.get("begin"))
 
         # interop test
         if msgcontent.get("test") == "interop":
@@ -97,7 +101,7 @@ class TestPlugin(Plugin):
 
         # dkimchecks test
         elif msgcontent.get("test") == "dkimchecks":
-            headers = message.get_mime_headers().as_string()
+            headers = message.get_mime_headers()
             self.output.submit_dkimchecks_result(selfaddr, sender, headers)
 
 
@@ -113,7 +117,13 @@ class SpiderPlugin(Plugin):
 
     @deltachat.account_hookimpl
     def ac_incoming_message(self, message: deltachat.Message):
+        received = time.time()
         message.create_chat()
+        msgcontent = parse_msg(message.text)
+        if msgcontent.get("test") == "throughput":
+            self.output.submit_throughput_delivery(message.get_sender_contact().addr, msgcontent.get("rate"),
+                                                   msgcontent.get("seq"), received)
+            return
         if message.filename == "":
             return  # only handle filetest
 
@@ -134,7 +144,9 @@ class SpiderPlugin(Plugin):
         tzone = datetime.datetime.now().tzinfo
         hops = parse_msg(message.get_message_info(), firsthop=message.time_sent.astimezone(tzone).isoformat())["hops"]
         hops.append(message.time_received.astimezone(tzone).isoformat())
-        self.output.submit_filetest_result(message.get_sender_contact().addr, str(testduration), hops)
+        headers = message.get_mime_headers()
+        message_id = headers.get("Message-ID") if headers is not None else None
+        self.output.submit_filetest_result(message.get_sender_contact().addr, str(testduration), hops, message_id)
         print("%s: %s: test message took %.1f seconds to spider." %
               (len(self.output.sending), message.get_sender_contact().addr, testduration))
 
@@ -173,6 +185,10 @@ def parse_msg(text: str, firsthop=None) -> dict:
             response["hops"].append(line.partition(" ")[2])
         if line.startswith("Test: "):
             response["test"] = line.partition(" ")[2]
+        if line.startswith("Rate: "):
+            response["rate"] = int(line.partition(" ")[2])
+        if line.startswith("Seq: "):
+            response["seq"] = int(line.partition(" ")[2])
     if response.get("received") and response.get("sent"):
         response["tdelta"] = (receiveddt - sentdt).total_seconds()
     return response
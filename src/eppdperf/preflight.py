@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import threading
+
+
+# how long the SMTP SIZE limit of a provider is trusted before it is checked again
+CACHE_MAX_AGE = 24 * 60 * 60
+
+# the headers and MIME structure deltachat adds to a file message, in bytes
+MIME_OVERHEAD = 2048
+
+
+class LimitsCache:
+    """Cache the SMTP SIZE limits of the providers in a JSON file, so a sweep over several file sizes only checks
+    them once. The free IMAP quota is not cached, as the mailboxes fill up with the test files of the sweep.
+
+    :param path: the JSON file with the cached limits, or None to keep them in memory only
+    :param max_age: seconds after which a cached limit is checked again
+    """
+
+    def __init__(self, path: str = None, max_age: float = CACHE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.entries = {}
+        self.lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key: str) -> dict:
+        """Return a cached limit, unless it expired.
+
+        :param key: e.g. "size:example.org"
+        :return: a dictionary with the limit as "value" and the timestamp of the check as "checked", or None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or time.time() - entry["checked"] > self.max_age:
+            return None
+        return entry
+
+    def set(self, key: str, value):
+        """Store a limit which was just checked.
+
+        :param key: e.g. "size:example.org"
+        :param value: the limit in bytes, or None if the server does not announce one
+        """
+        with self.lock:
+            self.entries[key] = {"value": value, "checked": time.time()}
+
+    def save(self):
+        """Write the cached limits to the JSON file, if there is one.
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+
+
+def estimate_message_size(filesize: int) -> int:
+    """Estimate how large the message with a test file is at least. The attachment is base64-encoded, which adds a
+    third; encryption would add more, so the estimate is a lower bound.
+
+    :param filesize: the size of the test file in bytes
+    :return: the minimum size of the message in bytes
+    """
+    return filesize * 4 // 3 + MIME_OVERHEAD
+
+
+def format_size(size: int) -> str:
+    """Format a size in bytes for the output.
+
+    :param size: the size in bytes
+    :return: e.g. "25.0MB"
+    """
+    return "%.1fMB" % (size / (1024 * 1024),)
+
+
+def check_limits(size: int, smtp_size: int, quota_free: int, spider_quota_free: int) -> str:
+    """Check whether a message can be sent and received at all.
+
+    :param size: the minimum size of the message in bytes
+    :param smtp_size: the SIZE limit the SMTP server of the sender announces, or None
+    :param quota_free: the free storage in the mailbox of the sender, which may keep a copy, or None
+    :param spider_quota_free: the free storage in the mailbox of the spider, or None
+    :return: why the message can not succeed, or None if it might
+    """
+    if smtp_size and size > smtp_size:
+        return "message of %s exceeds SMTP SIZE limit of %s" % (format_size(size), format_size(smtp_size))
+    if quota_free is not None and size > quota_free:
+        return "sender mailbox has only %s free" % (format_size(quota_free),)
+    if spider_quota_free is not None and size > spider_quota_free:
+        return "spider mailbox has only %s free" % (format_size(spider_quota_free),)
+    return None
@@ -0,0 +1,139 @@
+import sys
+import time
+import threading
+
+
+# leaf frames of threads which are blocked instead of using CPU, for platforms without per-thread CPU clocks
+BLOCKING_FUNCTIONS = ("threading.py:wait", "selectors.py:select", "queue.py:get",
+                      "socket.py:readinto", "ssl.py:read", "ssl.py:recv_into")
+
+
+class SamplingProfiler(threading.Thread):
+    """Sample the call stacks of all threads of the process in regular intervals.
+
+    This includes the main thread with its polling loops and the deltachat threads which run the plugin hooks.
+    Sampling only costs a few microseconds per interval, so it can stay enabled in long runs.
+
+    Each stack is weighted with the CPU time its thread used since the previous sample, read from the per-thread CPU
+    clock, so threads which wait inside C calls, like the deltachat event threads in dc_get_next_event, time.sleep,
+    or socket reads, do not show up. Where per-thread CPU clocks are not available, stacks are counted once per
+    sample instead, and only threads blocked in one of the BLOCKING_FUNCTIONS are left out.
+
+    :param interval: seconds between two samples
+    """
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(name="eppdperf-profiler", daemon=True)
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.cputimes = {}
+        self.cpuclocks = hasattr(time, "pthread_getcpuclockid")
+        self.unit = "us CPU" if self.cpuclocks else "samples"
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def get_cpu_time(self, ident: int) -> float:
+        """Return how much CPU time a thread used so far.
+
+        :param ident: the identifier of the thread
+        :return: seconds of CPU time, or None if the thread is gone
+        """
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except OSError:
+            return None
+
+    def get_weight(self, ident: int, frame) -> int:
+        """Return how much a sample of a thread counts.
+
+        :param ident: the identifier of the thread
+        :param frame: the current frame of the thread
+        :return: microseconds of CPU time since the previous sample, or 1 without per-thread CPU clocks
+        """
+        if not self.cpuclocks:
+            code = frame.f_code
+            if "%s:%s" % (code.co_filename.rpartition("/")[2], code.co_name) in BLOCKING_FUNCTIONS:
+                return 0
+            return 1
+        cputime = self.get_cpu_time(ident)
+        previous = self.cputimes.get(ident)
+        self.cputimes[ident] = cputime
+        if cputime is None or previous is None:
+            return 0
+        return round((cputime - previous) * 1000000)
+
+    def sample(self):
+        """Record the current call stack of every thread except the profiler itself.
+        """
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            weight = self.get_weight(ident, frame)
+            if weight <= 0:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s:%s" % (code.co_filename.rpartition("/")[2], code.co_name))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            key = ";".join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + weight
+        self.samples += 1
+
+    def stop(self):
+        """Stop sampling and wait for the profiler thread to finish.
+        """
+        self.stopped.set()
+        self.join()
+
+    def get_function_stats(self) -> [list]:
+        """Return how much of the samples was spent in each function.
+
+        :return: a list of [function, own weight, total weight] rows, most expensive first; the weights are
+            microseconds of CPU time, or the number of samples without per-thread CPU clocks
+        """
+        own = {}
+        total = {}
+        for key, count in self.stacks.items():
+            frames = key.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + count
+            for function in set(frames):
+                total[function] = total.get(function, 0) + count
+        stats = [[function, own.get(function, 0), count] for function, count in total.items()]
+        stats.sort(key=lambda row: row[1], reverse=True)
+        return stats
+
+    def write(self, path: str, top: int = 20):
+        """Write the samples as collapsed stacks, which flamegraph.pl or speedscope.app can display, and print the
+        functions where the most time was spent.
+
+        :param path: the file for the collapsed stacks
+        :param top: how many functions are printed
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write("%s %d\n" % (key, count))
+        print("Profile: %d samples every %.0f ms, in %s, most time spent in:" %
+              (self.samples, self.interval * 1000, self.unit))
+        for function, owncount, totalcount in self.get_function_stats()[:top]:
+            print("%9d own %9d total  %s" % (owncount, totalcount, function))
+        print("Writing profile to %s" % (path,))
+
+
+def start_profiler(interval: float = 0.005) -> SamplingProfiler:
+    """Start sampling the process in the background.
+
+    :param interval: seconds between two samples
+    :return: the running profiler
+    """
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    return profiler
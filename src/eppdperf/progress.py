@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+from .deadlines import Deadlines
+
+
+class ProgressReporter:
+    """Shows how far a test got while the main thread waits for the results: how many results arrived out of how
+    many are expected, the slowest outstanding providers, and when the test will presumably be finished.
+
+    The slowest providers are those whose outstanding messages are the furthest past their deadline, or the closest
+    to it; an operator can tell from them which provider a run is stuck on.
+
+    The progress is shown as a refreshing line if stdout is a terminal, and written as JSON to the status file, if
+    one is set; operators can watch it to stop a stuck run early.
+    """
+
+    def __init__(self):
+        self.status_file = None
+        self.terminal = sys.stdout.isatty()
+        self.interval = 1.0
+        self.top = 5
+
+    @contextmanager
+    def watch(self, output, test: str, timeout: float, deadlines: Deadlines = None, sent: float = None):
+        """Report the progress of a test while the code inside the with block waits for its results.
+
+        :param output: Output object which gathers the test results, see Output.get_progress
+        :param test: the name of the test, e.g. "interop"
+        :param timeout: seconds after which the test is aborted
+        :param deadlines: per-provider deadlines of the messages; without them, the timeout applies to all providers
+        :param sent: timestamp from which the deadlines count, usually when the messages were sent; defaults to now
+        """
+        if not self.terminal and self.status_file is None:
+            yield
+            return
+        begin = time.time()
+        if deadlines is None:
+            deadlines = Deadlines({}, timeout)
+        if sent is None:
+            sent = begin
+        stopped = threading.Event()
+        thread = threading.Thread(target=self.run, args=(output, test, begin, timeout, deadlines, sent, stopped),
+                                  name="eppdperf-progress", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+            self.report(self.get_status(output, test, begin, timeout, deadlines, sent, finished=True))
+            if self.terminal:
+                sys.stdout.write("\n")
+
+    def run(self, output, test: str, begin: float, timeout: float, deadlines: Deadlines, sent: float,
+            stopped: threading.Event):
+        while not stopped.wait(self.interval):
+            self.report(self.get_status(output, test, begin, timeout, deadlines, sent))
+
+    def get_status(self, output, test: str, begin: float, timeout: float, deadlines: Deadlines, sent: float,
+                   finished: bool = False) -> dict:
+        """Collect the progress of a test from the counters of the Output object.
+
+        :param output: Output object which gathers the test results
+        :param test: the name of the test
+        :param begin: timestamp when the wait for the results began
+        :param timeout: seconds after which the test is aborted
+        :param deadlines: per-provider deadlines of the messages
+        :param sent: timestamp from which the deadlines count
+        :param finished: whether the wait is over
+        :return: a dictionary which can be written as JSON; "slowest" lists the self.top slowest providers with
+            how many seconds their outstanding messages are overdue, negative if the deadline is still ahead, and
+            how many messages they are missing
+        """
+        received, expected, _ = output.get_progress()
+        now = time.time()
+        elapsed = now - begin
+        remaining = max(0.0, begin + timeout - now)
+        if finished or received >= expected:
+            eta = 0.0
+        elif received > 0:
+            # assume the remaining results arrive at the rate the first ones did, but not after the timeout
+            eta = min(remaining, (expected - received) * elapsed / received)
+        else:
+            eta = remaining
+        return {
+            "test": test,
+            "finished": finished,
+            "received": received,
+            "expected": expected,
+            "elapsed": round(elapsed, 1),
+            "eta": round(eta, 1),
+            "slowest": self.get_slowest(output.get_outstanding(), deadlines, now - sent),
+            "timestamp": now,
+        }
+
+    def get_slowest(self, outstanding: [(str, str)], deadlines: Deadlines, elapsed: float) -> [dict]:
+        """Rank the providers of the outstanding messages by how far their messages are past the deadline.
+
+        A message counts for the provider of its receiver and of its sender; among providers which are equally
+        overdue, the one with more outstanding messages comes first.
+
+        :param outstanding: (receiver, sender) tuples, see Output.get_outstanding
+        :param deadlines: per-provider deadlines of the messages
+        :param elapsed: seconds since the messages were sent
+        :return: up to self.top dictionaries with the "domain", the seconds it is "overdue", and how many messages
+            are "outstanding"
+        """
+        domains = {}
+        for receiver, sender in outstanding:
+            overdue = elapsed - deadlines.get_item(receiver, sender)
+            for addr in {receiver, sender} - {None}:
+                domain = addr.split("@")[-1]
+                worst, count = domains.get(domain, (overdue, 0))
+                domains[domain] = (max(worst, overdue), count + 1)
+        slowest = sorted(domains.items(), key=lambda item: item[1], reverse=True)[:self.top]
+        return [{"domain": domain, "overdue": round(overdue, 1), "outstanding": count}
+                for domain, (overdue, count) in slowest]
+
+    def report(self, status: dict):
+        """Show the progress in the terminal and write it to the status file.
+
+        :param status: the progress, as returned by get_status
+        """
+        if self.terminal:
+            line = "%s: %s/%s received, %.0fs elapsed, ETA %.0fs" % (
+                status["test"], status["received"], status["expected"], status["elapsed"], status["eta"])
+            if status["slowest"]:
+                line += ", slowest: " + ", ".join(
+                    "%s (%+.0fs, %s missing)" % (p["domain"], p["overdue"], p["outstanding"]) for p in status["slowest"])
+            sys.stdout.write("\r%s\033[K" % (line,))
+            sys.stdout.flush()
+        if self.status_file is not None:
+            # replace the file at once, so readers never see a half-written status
+            with open(self.status_file + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(status, f)
+            os.replace(self.status_file + ".tmp", self.status_file)
+
+
+reporter = ProgressReporter()
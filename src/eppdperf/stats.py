@@ -0,0 +1,74 @@
+import math
+
+
+def percentile(values: [float], p: float) -> float:
+    """Return the p-th percentile of a list of values, interpolating between the closest ranks.
+
+    :param values: a non-empty list of numbers
+    :param p: the percentile, between 0 and 100
+    :return: the percentile
+    """
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def median(values: [float]) -> float:
+    """Return the median of a list of values.
+
+    :param values: a non-empty list of numbers
+    :return: the median
+    """
+    return percentile(values, 50)
+
+
+def mann_whitney_greater(baseline: [float], new: [float]) -> float:
+    """One-sided Mann-Whitney U test whether the new values tend to be greater than the baseline values.
+
+    Uses the normal approximation with a correction for ties, which is good enough for the sample sizes of a few
+    runs; it does not need the values to be normally distributed like a t-test would.
+
+    :param baseline: the values of the baseline, non-empty
+    :param new: the values which are compared with the baseline, non-empty
+    :return: the p-value; small values mean the new values are very likely greater
+    """
+    values = sorted([(v, 0) for v in baseline] + [(v, 1) for v in new])
+    ranks = [0.0] * len(values)
+    ties = 0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        ties += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    n1 = len(baseline)
+    n2 = len(new)
+    n = n1 + n2
+    u = sum(rank for rank, (_, group) in zip(ranks, values) if group == 1) - n2 * (n2 + 1) / 2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def sign_test_greater(baseline: [float], new: [float]) -> float:
+    """One-sided paired sign test whether the new values tend to be greater than their baseline values.
+
+    Only counts in which direction each pair changed, so it works with a single measurement per pair, e.g. one
+    duration per provider in each of two runs; pairs which did not change are ignored.
+
+    :param baseline: the values of the baseline
+    :param new: the values which are compared with the baseline, in the same order
+    :return: the exact p-value; small values mean the new values are very likely greater
+    """
+    changes = [after > before for before, after in zip(baseline, new) if after != before]
+    n = len(changes)
+    k = sum(changes)
+    binomials = (math.factorial(n) // (math.factorial(i) * math.factorial(n - i)) for i in range(k, n + 1))
+    return sum(binomials) / 2 ** n
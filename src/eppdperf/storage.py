@@ -0,0 +1,152 @@
+import os
+import time
+import _thread
+import shutil
+import sqlite3
+import tempfile
+import threading
+
+from .stats import median
+
+
+# tmpfs mount which keeps files in memory on Linux
+RAM_DIR = "/dev/shm"
+
+# the model of the storage estimate: how many database commits deltachat does for a message, on both sides
+# together; the sender inserts the message and updates its state after sending it, the receiver inserts it and marks
+# it as seen. It is not measured per message, so the storage and network split of the results is an estimate.
+MESSAGE_COMMITS = 4
+
+
+def create_ram_dir(limit: int) -> tempfile.TemporaryDirectory:
+    """Create a temporary account data directory in memory.
+
+    :param limit: how many bytes the account data may take up at most
+    :return: the temporary directory, which is deleted with the object
+    """
+    assert os.path.isdir(RAM_DIR), "--storage ram needs a tmpfs at %s" % (RAM_DIR,)
+    free = shutil.disk_usage(RAM_DIR).free
+    assert free >= limit, "only %s MB free in %s, but --ram_limit is %s MB" % (
+        free // (1024 * 1024), RAM_DIR, limit // (1024 * 1024))
+    return tempfile.TemporaryDirectory(prefix="perfanal", dir=RAM_DIR)
+
+
+def get_dir_size(path: str) -> int:
+    """Return how many bytes the files in a directory take up.
+
+    :param path: the directory
+    :return: the size of all files in it, recursively
+    """
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                continue  # deleted in the meantime
+    return size
+
+
+class StorageMonitor:
+    """Check the size of the in-memory account data while the test runs, and abort the run as soon as it grows
+    beyond --ram_limit. The run is aborted like with Ctrl+C, by interrupting the main thread: the tests which wait
+    for messages stop waiting and write the results they have so far, the other tests stop right away.
+
+    :param path: the account data directory
+    :param limit: how many bytes the account data may take up at most
+    :param interval: seconds between two checks
+    """
+
+    def __init__(self, path: str, limit: int, interval: float = 5.0):
+        self.path = path
+        self.limit = limit
+        self.interval = interval
+        self.peak = 0
+        self.exceeded = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="eppdperf-storage", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        while True:
+            if self.check():
+                _thread.interrupt_main()
+                return
+            if self.stopped.wait(self.interval):
+                return
+
+    def check(self) -> bool:
+        """Measure the account data once.
+
+        :return: True the first time it is beyond the limit
+        """
+        size = get_dir_size(self.path)
+        self.peak = max(self.peak, size)
+        if size <= self.limit or self.exceeded:
+            return False
+        self.exceeded = True
+        print("[ERROR] account data in %s takes up %s MB, more than --ram_limit %s MB; aborting the run" %
+              (self.path, size // (1024 * 1024), self.limit // (1024 * 1024)))
+        return True
+
+    def stop(self) -> int:
+        """Stop checking, after a last check.
+
+        :return: the largest size of the account data in bytes which was seen during the run
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.check()
+        return self.peak
+
+
+def measure_storage_latency(path: str, repetitions: int = 20) -> (float, float):
+    """Measure how long the local writes take which deltachat does for each message: a database commit and an
+    attachment written to the blobdir.
+
+    :param path: the directory in which the storage is measured
+    :param repetitions: how often each write is measured
+    :return: median seconds of a sqlite commit, and of writing and syncing a 1 MB blob
+    """
+    workdir = tempfile.mkdtemp(prefix="storagetest", dir=path)
+    try:
+        db = sqlite3.connect(os.path.join(workdir, "db.sqlite"))
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE msgs (id INTEGER PRIMARY KEY, txt TEXT)")
+        commits = []
+        for i in range(repetitions):
+            begin = time.time()
+            db.execute("INSERT INTO msgs (txt) VALUES (?)", ("storage test %s" % (i,),))
+            db.commit()
+            commits.append(time.time() - begin)
+        db.close()
+        blob = os.urandom(1024 * 1024)
+        writes = []
+        for i in range(repetitions):
+            begin = time.time()
+            with open(os.path.join(workdir, "blob%s" % (i,)), "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            writes.append(time.time() - begin)
+    finally:
+        shutil.rmtree(workdir)
+    return median(commits), median(writes)
+
+
+def estimate_storage_time(commit: float, blobwrite: float, megabytes: float = 0.0) -> float:
+    """Estimate how much of the measured time of a message was spent on local writes instead of the network.
+
+    The estimate assumes MESSAGE_COMMITS database commits per message, and the attachment written once to the
+    blobdir of the sender and once to that of the receiver, each taking as long as the writes measured at the start
+    of the run. Deltachat's actual writes are not measured, so the result is only an estimate; to measure the
+    difference directly, compare a run with --storage disk to one with --storage ram.
+
+    :param commit: median seconds of a database commit, see measure_storage_latency
+    :param blobwrite: median seconds of writing and syncing a 1 MB blob
+    :param megabytes: the size of the attachment in MB, if there is one
+    :return: the estimated seconds spent on local storage
+    """
+    return MESSAGE_COMMITS * commit + 2 * megabytes * blobwrite
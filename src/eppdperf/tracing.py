@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+class Tracer:
+    """Collects the spans of a run and writes them in the Chrome trace event format, which can be opened e.g. in
+    chrome://tracing or https://ui.perfetto.dev. Every account gets its own lane; phases of the whole run are
+    shown in the "main" lane.
+
+    Until enabled, spans are not recorded at all.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.lanes = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def get_lane(self, lane: str) -> int:
+        """Return the trace thread ID of a lane, and name it in the trace if it is new.
+
+        :param lane: the name of the lane, e.g. "main" or an email address
+        :return: the thread ID which is used for the lane in the trace
+        """
+        with self.lock:
+            if lane not in self.lanes:
+                self.lanes[lane] = len(self.lanes)
+                self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": self.lanes[lane],
+                                    "args": {"name": lane}})
+            return self.lanes[lane]
+
+    @contextmanager
+    def span(self, name: str, lane: str = "main", **args):
+        """Record how long the code inside the with block takes.
+
+        :param name: the name of the phase
+        :param lane: the lane in which the span is shown, e.g. the email address of the account
+        :param args: additional information which is shown with the span
+        """
+        if not self.enabled:
+            yield
+            return
+        begin = time.time()
+        try:
+            yield
+        finally:
+            self.add_span(name, lane, begin, time.time(), args)
+
+    def add_span(self, name: str, lane: str, begin: float, end: float, args: dict = None):
+        """Record a span which was measured elsewhere.
+
+        :param name: the name of the phase
+        :param lane: the lane in which the span is shown
+        :param begin: timestamp when the phase began
+        :param end: timestamp when the phase ended
+        :param args: additional information which is shown with the span
+        """
+        if not self.enabled:
+            return
+        event = {"name": name, "ph": "X", "pid": self.pid, "tid": self.get_lane(lane),
+                 "ts": int(begin * 1000000), "dur": int((end - begin) * 1000000), "args": args or {}}
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path: str):
+        """Write the recorded spans to a JSON file.
+
+        :param path: the trace file
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print("Writing trace to %s" % (path,))
+
+
+tracer = Tracer()
+span = tracer.span
@@ -0,0 +1,37 @@
+import datetime
+
+from eppdperf.hops import parse_hop, parse_hops, get_slowest_hop
+
+
+def timestamp(isostr: str) -> float:
+    return datetime.datetime.fromisoformat(isostr).timestamp()
+
+
+def test_live_hops():
+    # as plugins.SpiderPlugin collects them from the message info during a run
+    records = parse_hops([
+        "2022-01-11T20:56:00+01:00",
+        "From: [127.0.0.1]; By: disroot.org; Date: Tue, 11 Jan 2022 20:56:33 +0100",
+        "From: knopi.disroot.org; By: hq5.merlinux.eu; Date: Tue, 11 Jan 2022 20:57:20 +0100",
+        "2022-01-11T20:57:32+01:00",
+    ])
+    assert [r["host"] for r in records] == ["sender", "disroot.org", "hq5.merlinux.eu", "spider"]
+    assert records[1]["from"] == "[127.0.0.1]"
+    assert records[2]["timestamp"] == timestamp("2022-01-11T20:57:20+01:00")
+    assert [r["delay"] for r in records] == [None, 33, 47, 12]
+    assert get_slowest_hop(records) == ("hq5.merlinux.eu", 47)
+
+
+def test_result_file_hops():
+    # as written to results/file-*.csv, without semicolons and commas, with the Sent and Received lines of older runs
+    records = parse_hops([
+        "Sent: 2022.01.11 19:56:14 UTC",
+        "By: kubenode510.mail-prod1.omega.ir2.yahoo.com Date: Tue 11 Jan 2022 20:56:33 +0100",
+        "Received: 2022.01.11 20:06:07 UTC",
+    ])
+    assert [r["host"] for r in records] == ["sender", "kubenode510.mail-prod1.omega.ir2.yahoo.com", "spider"]
+    assert [r["delay"] for r in records] == [None, 19, 574]
+
+
+def test_hop_without_date():
+    assert parse_hop("From: a.example; By: b.example;") == {"from": "a.example", "by": "b.example", "timestamp": None}